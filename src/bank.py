@@ -0,0 +1,168 @@
+import mmap
+import os
+import random
+import struct
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Optional
+from sudoku import SudokuState, Difficulty
+
+if TYPE_CHECKING:
+    from grader import Grader
+from puzzle_io import NUMBERS_SIZE, pack_numbers, unpack_numbers
+
+# File layout:
+#   header:   magic, version, number of sections
+#   sections: (capacity, count) for every difficulty, in Difficulty order
+#   records:  one region of 'capacity' records per difficulty
+# A record is a puzzle packed as 81 4-bit numbers, 0 for an empty cell
+# (see puzzle_io.pack_numbers).
+# The first 'count' records of a region are live; drawing one moves the
+# last live record into its slot, so both drawing and adding are O(1).
+MAGIC = b"SDKB"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+SECTION = struct.Struct("<II")
+RECORD_SIZE = NUMBERS_SIZE
+
+
+class PuzzleBank:
+    path: str
+    capacity: dict[Difficulty, int]
+    lock: threading.Lock
+    __file: BinaryIO
+    __map: mmap.mmap
+    __offset: dict[Difficulty, int]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.__file = open(path, "r+b")
+        self.__map = mmap.mmap(self.__file.fileno(), 0)
+        magic, version, nsection = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC or version != VERSION or nsection != len(Difficulty):
+            self.close()
+            raise ValueError(f"{path} is not a puzzle bank")
+
+        self.capacity = {}
+        self.__offset = {}
+        offset = HEADER.size + SECTION.size * len(Difficulty)
+        for d in Difficulty:
+            capacity, _ = SECTION.unpack_from(self.__map, self.__section_pos(d))
+            self.capacity[d] = capacity
+            self.__offset[d] = offset
+            offset += capacity * RECORD_SIZE
+
+    # create an empty bank holding up to 'capacity' puzzles per difficulty
+    @staticmethod
+    def create(path: str, capacity: int) -> "PuzzleBank":
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(Difficulty)))
+            for _ in Difficulty:
+                f.write(SECTION.pack(capacity, 0))
+            f.truncate(f.tell() + capacity * RECORD_SIZE * len(Difficulty))
+        return PuzzleBank(path)
+
+    @staticmethod
+    def open_or_create(path: str, capacity: int) -> "PuzzleBank":
+        if os.path.exists(path):
+            return PuzzleBank(path)
+        return PuzzleBank.create(path, capacity)
+
+    @staticmethod
+    def __section_pos(difficulty: Difficulty) -> int:
+        return HEADER.size + SECTION.size * difficulty.value
+
+    def __get_count(self, difficulty: Difficulty) -> int:
+        return SECTION.unpack_from(self.__map, self.__section_pos(difficulty))[1]
+
+    def __set_count(self, difficulty: Difficulty, count: int):
+        SECTION.pack_into(self.__map, self.__section_pos(difficulty), self.capacity[difficulty], count)
+
+    def __record_pos(self, difficulty: Difficulty, index: int) -> int:
+        return self.__offset[difficulty] + index * RECORD_SIZE
+
+    def size(self, difficulty: Difficulty) -> int:
+        with self.lock:
+            return self.__get_count(difficulty)
+
+    # take a random puzzle out of the bank, None if it is empty
+    def draw(self, difficulty: Difficulty) -> Optional[str]:
+        with self.lock:
+            count = self.__get_count(difficulty)
+            if count == 0:
+                return None
+            pos = self.__record_pos(difficulty, random.randrange(count))
+            last = self.__record_pos(difficulty, count - 1)
+            record = self.__map[pos:pos + RECORD_SIZE]
+            self.__map[pos:pos + RECORD_SIZE] = self.__map[last:last + RECORD_SIZE]
+            self.__set_count(difficulty, count - 1)
+        return unpack_numbers(record)
+
+    # store a puzzle, returns False if the bank is full for that difficulty
+    def add(self, difficulty: Difficulty, line: str) -> bool:
+        record = pack_numbers(line)
+        with self.lock:
+            count = self.__get_count(difficulty)
+            if count == self.capacity[difficulty]:
+                return False
+            pos = self.__record_pos(difficulty, count)
+            self.__map[pos:pos + RECORD_SIZE] = record
+            self.__set_count(difficulty, count + 1)
+        return True
+
+    def flush(self):
+        with self.lock:
+            self.__map.flush()
+
+    def close(self):
+        if not self.__map.closed:
+            self.__map.close()
+        self.__file.close()
+
+
+# background thread topping the bank up whenever a difficulty drops below
+# 'low_water' puzzles, until it is full again. With a grader each puzzle
+# is the first of up to 50 candidates rated in the band of its difficulty,
+# or the closest one when none is.
+class BankRefiller(threading.Thread):
+    bank: PuzzleBank
+    low_water: int
+    grader: Optional["Grader"]
+    __wakeup: threading.Event
+    __stopped: bool
+
+    def __init__(self, bank: PuzzleBank, low_water: int, grader: Optional["Grader"] = None):
+        super().__init__(name="bank-refiller", daemon=True)
+        self.bank = bank
+        self.low_water = low_water
+        self.grader = grader
+        self.__wakeup = threading.Event()
+        self.__stopped = False
+
+    # a PuzzleSource that wakes the refiller after every draw
+    def draw(self, difficulty: Difficulty) -> Optional[str]:
+        line = self.bank.draw(difficulty)
+        self.__wakeup.set()
+        return line
+
+    def stop(self):
+        self.__stopped = True
+        self.__wakeup.set()
+
+    def __refill(self, difficulty: Difficulty):
+        while not self.__stopped and self.bank.size(difficulty) < self.bank.capacity[difficulty]:
+            if self.grader is not None:
+                line = self.grader.generate(difficulty)
+            else:
+                line = SudokuState(difficulty).to_line()
+            if not self.bank.add(difficulty, line):
+                break
+        self.bank.flush()
+
+    def run(self):
+        while not self.__stopped:
+            for d in Difficulty:
+                if self.bank.size(d) < self.low_water:
+                    self.__refill(d)
+            self.__wakeup.wait()
+            self.__wakeup.clear()
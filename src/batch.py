@@ -0,0 +1,379 @@
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import NamedTuple, Optional, TextIO
+from sudoku import SudokuState, Difficulty
+from geometry import STANDARD
+from bank import PuzzleBank
+from puzzle_io import PuzzleRecord, iter_lines, read_puzzle_lines, read_puzzles, write_puzzles
+from solve_stats import SolveStats, percentiles
+from solve_cache import SolveCache
+from symmetry import PuzzleMultiplier, Transform, canonical_form
+from grader import Grader, difficulty_of
+
+# number of puzzles a worker generates per task
+DEFAULT_CHUNK_SIZE = 64
+# number of puzzles a worker solves per task
+DEFAULT_SOLVE_CHUNK_SIZE = 256
+SOLVERS = ["ord_solve", "opt_solve", "dlx_solve", "logic_solve"]
+
+
+def generate_chunk(seed: int, count: int, difficulty: Difficulty, rated: bool = False,
+                   box_size: int = 3) -> list[str]:
+    random.seed(seed)
+    if rated:
+        if box_size != 3:
+            raise ValueError("only 9x9 puzzles are rated")
+        grader = Grader()
+        return [grader.generate(difficulty) for _ in range(count)]
+    return [SudokuState(difficulty, box_size=box_size).to_line() for _ in range(count)]
+
+
+# split 'count' puzzles into tasks of (seed, size). Every task gets its own
+# seed so a run is reproducible no matter which worker picks up which task.
+def _chunks(count: int, chunk_size: int, seed: int) -> Iterator[tuple[int, int]]:
+    for index, start in enumerate(range(0, count, chunk_size)):
+        yield seed * 1000003 + index, min(chunk_size, count - start)
+
+
+# generate 'count' puzzles over a process pool and write them to 'out' as
+# 81-character lines in completion order. At most two tasks per worker are
+# in flight, so memory does not grow with 'count'. With 'rated', each
+# puzzle is the first of up to 50 candidates rated in the band of
+# 'difficulty', or the closest one when none is: best effort, not a filter.
+def generate(out: TextIO, count: int, difficulty: Difficulty, workers: int,
+             seed: int, chunk_size: int = DEFAULT_CHUNK_SIZE, rated: bool = False):
+    tasks = _chunks(count, chunk_size, seed)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: set[Future[list[str]]] = set()
+        while True:
+            for task_seed, size in tasks:
+                pending.add(pool.submit(generate_chunk, task_seed, size, difficulty, rated))
+                if len(pending) >= 2 * workers:
+                    break
+            if len(pending) == 0:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                out.writelines(line + "\n" for line in future.result())
+            out.flush()
+
+
+# derive 'count' puzzles from the seed puzzles by random symmetry
+# transforms. No search is involved, so this runs in-process. With 'rated',
+# seeds outside the rating band of 'difficulty' are left out. Seeds without
+# a unique solution are skipped and counted on stderr.
+def multiply(out: TextIO, count: int, difficulty: Difficulty, seeds: Iterable[PuzzleRecord], seed: int,
+             rated: bool = False):
+    multiplier = PuzzleMultiplier(rng=random.Random(seed))
+    grader = Grader() if rated else None
+    added = skipped = 0
+    for record in seeds:
+        if grader is not None and not grader.matches(record.puzzle(), difficulty):
+            continue
+        try:
+            multiplier.add_seed(difficulty, record.puzzle())
+        except ValueError:
+            skipped += 1
+            continue
+        added += 1
+    if skipped != 0:
+        print(f"skipped {skipped} seed puzzles without a unique solution", file=sys.stderr)
+    if added == 0:
+        raise SystemExit(f"no seed puzzle rated {difficulty.name}")
+    for _ in range(count):
+        out.write(multiplier.draw(difficulty) + "\n")
+
+
+def _cmd_generate(args: argparse.Namespace):
+    difficulty = Difficulty[args.difficulty]
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    out = open(args.output, "w") if args.output != "-" else sys.stdout
+    try:
+        if args.seeds is not None:
+            multiply(out, args.count, difficulty, read_puzzles(args.seeds), seed, args.rated)
+        else:
+            generate(out, args.count, difficulty, args.workers, seed, args.chunk_size, args.rated)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+class SolveResult(NamedTuple):
+    # "solved", "cached", "unsolvable", "invalid" (conflicting givens or not
+    # a puzzle line) or "timeout"
+    status: str
+    # the completed grid, or the puzzle itself when it was not solved
+    line: str
+    seconds: float
+    nodes: int
+
+
+def solve_one(state: SudokuState, solver: str, timeout: Optional[float]) -> SolveResult:
+    start = time.perf_counter()
+    if state.has_conflict():
+        return SolveResult("invalid", state.to_line(), time.perf_counter() - start, 0)
+
+    deadline = start + timeout if timeout is not None else None
+    stats = SolveStats()
+    should_stop = (lambda: time.perf_counter() > deadline) if deadline is not None else None
+    solution = getattr(state, solver)(stats, should_stop)
+    seconds = time.perf_counter() - start
+    if stats.cancelled:
+        return SolveResult("timeout", state.to_line(), seconds, stats.nodes)
+    if not stats.solved:
+        return SolveResult("unsolvable", state.to_line(), seconds, stats.nodes)
+    numbers = bytearray(state.numbers)
+    for (r, c, n) in solution:
+        numbers[r * state.size + c] = n
+    return SolveResult("solved", state.geometry.format_line(numbers), seconds, stats.nodes)
+
+
+# a malformed line is reported as invalid rather than failing its whole chunk
+def solve_line(line: str, solver: str, timeout: Optional[float]) -> SolveResult:
+    try:
+        state = SudokuState.from_line(line, Difficulty.HARD)
+    except ValueError:
+        return SolveResult("invalid", line, 0.0, 0)
+    return solve_one(state, solver, timeout)
+
+
+def solve_chunk(lines: list[str], solver: str, timeout: Optional[float]) -> list[SolveResult]:
+    return [solve_line(line, solver, timeout) for line in lines]
+
+
+class _SolveTask(NamedTuple):
+    # canonical key and transform of every puzzle, empty without a cache and
+    # None for the lines that are not 9x9 puzzles, which bypass it
+    forms: list[Optional[tuple[bytes, Transform]]]
+    # results known without solving, None where the puzzle went to the pool
+    cached: list[Optional[SolveResult]]
+    future: Future[list[SolveResult]]
+
+
+def _submit(pool: ProcessPoolExecutor, lines: list[str], solver: str, timeout: Optional[float],
+            cache: Optional[SolveCache]) -> _SolveTask:
+    forms: list[Optional[tuple[bytes, Transform]]] = []
+    cached: list[Optional[SolveResult]] = [None] * len(lines)
+    if cache is not None:
+        for k, line in enumerate(lines):
+            start = time.perf_counter()
+            try:
+                numbers = STANDARD.parse_line(line)
+            except ValueError:
+                forms.append(None)
+                continue
+            key, transform = canonical_form(bytes(numbers))
+            forms.append((key, transform))
+            solution = cache.get(key)
+            if solution is not None:
+                grid = "".join(map(str, transform.invert(solution)))
+                cached[k] = SolveResult("cached", grid, time.perf_counter() - start, 0)
+    misses = [line for line, result in zip(lines, cached) if result is None]
+    return _SolveTask(forms, cached, pool.submit(solve_chunk, misses, solver, timeout))
+
+
+def _collect(task: _SolveTask, cache: Optional[SolveCache]) -> list[SolveResult]:
+    solved = iter(task.future.result())
+    results = []
+    for k, result in enumerate(task.cached):
+        if result is None:
+            result = next(solved)
+            if cache is not None and result.status == "solved" and (form := task.forms[k]) is not None:
+                key, transform = form
+                cache.put(key, transform.apply(bytes(int(ch) for ch in result.line)))
+        results.append(result)
+    return results
+
+
+# solve the puzzle lines of 'puzzles' over a process pool, 'chunk_size' per
+# task, and yield the results in input order; a line that is not a puzzle
+# gets an invalid result in its place. At most two tasks per worker are in
+# flight, so memory does not grow with the input. With a cache, puzzles
+# solved before (up to canonical form) are answered from it and new solutions
+# are added to it, all from this process.
+def solve(puzzles: Iterable[str], solver: str, workers: int, timeout: Optional[float],
+          chunk_size: int = DEFAULT_SOLVE_CHUNK_SIZE, cache: Optional[SolveCache] = None) -> Iterator[SolveResult]:
+    puzzles = iter(puzzles)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: deque[_SolveTask] = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                lines = list(islice(puzzles, chunk_size))
+                if len(lines) == 0:
+                    break
+                pending.append(_submit(pool, lines, solver, timeout, cache))
+            if len(pending) == 0:
+                return
+            yield from _collect(pending.popleft(), cache)
+
+
+def _read_input(path: str) -> Iterator[PuzzleRecord]:
+    if path == "-":
+        return iter_lines(sys.stdin)
+    return read_puzzles(path)
+
+
+# load puzzles, lines or packed, into a puzzle bank, creating it if needed.
+# Only the givens of a packed game are banked, and lines that are not 9x9
+# puzzles are skipped and counted.
+def _cmd_bank(args: argparse.Namespace):
+    difficulty = Difficulty[args.difficulty]
+    bank = PuzzleBank.open_or_create(args.bank, args.capacity)
+    added = 0
+    skipped = 0
+    try:
+        for line in read_puzzle_lines(args.input):
+            try:
+                if not bank.add(difficulty, line):
+                    break
+            except ValueError:
+                skipped += 1
+                continue
+            added += 1
+        print(f"added {added} puzzles, {bank.size(difficulty)}/{bank.capacity[difficulty]} {difficulty.name}"
+              + (f", skipped {skipped} lines that are not puzzles" if skipped != 0 else ""), file=sys.stderr)
+    finally:
+        bank.flush()
+        bank.close()
+
+
+# convert between the line and packed formats, streaming record by record
+def _cmd_convert(args: argparse.Namespace):
+    count = write_puzzles(args.output, _read_input(args.input), packed=args.packed, with_notes=args.notes)
+    print(f"wrote {count} puzzles", file=sys.stderr)
+
+
+# solve a puzzle file, writing one line per puzzle in input order: the
+# solution, or the puzzle unchanged if it was not solved. Per-puzzle status
+# and timings go to --timings as CSV, a summary to stderr.
+def _cmd_solve(args: argparse.Namespace):
+    out = open(args.output, "w") if args.output != "-" else sys.stdout
+    timings = open(args.timings, "w") if args.timings is not None else None
+    if timings is not None:
+        timings.write("index,status,seconds,nodes\n")
+    cache = SolveCache(args.cache_size, args.cache) if args.cache is not None else None
+    statuses: Counter = Counter()
+    samples = []
+    start = time.perf_counter()
+    try:
+        results = solve(read_puzzle_lines(args.input), args.solver, args.workers, args.timeout, args.chunk_size, cache)
+        for index, result in enumerate(results):
+            out.write(result.line + "\n")
+            if timings is not None:
+                timings.write(f"{index},{result.status},{result.seconds:.6f},{result.nodes}\n")
+            statuses[result.status] += 1
+            samples.append(result.seconds)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if timings is not None:
+            timings.close()
+        if cache is not None:
+            cache.close()
+    elapsed = time.perf_counter() - start
+
+    total = len(samples)
+    print(f"{total} puzzles in {elapsed:.2f}s, {total / elapsed if elapsed > 0 else 0:.1f} puzzles/s, "
+          + ", ".join(f"{status} {count}" for status, count in sorted(statuses.items())), file=sys.stderr)
+    if total != 0:
+        summary = percentiles(samples)
+        print("per puzzle: " + ", ".join(f"{key} {summary[key] * 1000:.3f}ms"
+                                         for key in ("mean", "p50", "p90", "p99", "max")), file=sys.stderr)
+
+
+# rate every puzzle of a file: CSV of index, level, hardest technique,
+# deductions, search nodes and the difficulty band, counts to stderr
+def _cmd_grade(args: argparse.Namespace):
+    out = open(args.output, "w") if args.output != "-" else sys.stdout
+    grader = Grader(args.cache_size)
+    bands: Counter = Counter()
+    start = time.perf_counter()
+    try:
+        out.write("index,level,technique,steps,nodes,difficulty\n")
+        for index, record in enumerate(_read_input(args.input)):
+            try:
+                rating = grader.rate(record.puzzle())
+            except ValueError:
+                out.write(f"{index},,unsolvable,,,\n")
+                bands["unsolvable"] += 1
+                continue
+            difficulty = difficulty_of(rating).name
+            out.write(f"{index},{rating.level},{rating.technique},{rating.steps},{rating.nodes},{difficulty}\n")
+            bands[difficulty] += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    total = sum(bands.values())
+    print(f"{total} puzzles in {elapsed:.2f}s, " + ", ".join(f"{band} {count}" for band, count in sorted(bands.items()))
+          + f", {grader.hits} rated before (up to canonical form)", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="batch", description="headless sudoku batch jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="generate puzzles as 81-character lines")
+    generate_parser.add_argument("--count", type=int, required=True)
+    generate_parser.add_argument("--difficulty", choices=[d.name for d in Difficulty], default=Difficulty.EASY.name)
+    generate_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    generate_parser.add_argument("--seed", type=int, default=None)
+    generate_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    generate_parser.add_argument("--output", default="-", help="output file, '-' for stdout")
+    generate_parser.add_argument("--seeds", default=None,
+                                 help="derive the puzzles from the unique puzzles of this file instead of searching")
+    generate_parser.add_argument("--rated", action="store_true",
+                                 help="prefer puzzles whose technique rating matches the difficulty (best effort: "
+                                      "the closest of 50 candidates when none matches)")
+    generate_parser.set_defaults(handler=_cmd_generate)
+
+    bank_parser = commands.add_parser("bank", help="load generated puzzles into a puzzle bank")
+    bank_parser.add_argument("--bank", required=True, help="bank file, created if missing")
+    bank_parser.add_argument("--difficulty", choices=[d.name for d in Difficulty], required=True)
+    bank_parser.add_argument("--capacity", type=int, default=10000,
+                             help="puzzles per difficulty when creating the bank")
+    bank_parser.add_argument("--input", default="-",
+                             help="file of 81-character lines or packed records, '-' for stdin lines")
+    bank_parser.set_defaults(handler=_cmd_bank)
+
+    convert_parser = commands.add_parser("convert", help="convert puzzles between line and packed files")
+    convert_parser.add_argument("--input", default="-",
+                                help="file of 81-character lines or packed records, '-' for stdin lines")
+    convert_parser.add_argument("--output", required=True)
+    convert_parser.add_argument("--packed", action="store_true", help="write packed records instead of lines")
+    convert_parser.add_argument("--notes", action="store_true", help="reserve note bitmasks in packed records")
+    convert_parser.set_defaults(handler=_cmd_convert)
+
+    solve_parser = commands.add_parser("solve", help="solve a file of puzzles over a process pool")
+    solve_parser.add_argument("--input", default="-",
+                              help="file of 81-character lines or packed records, '-' for stdin lines")
+    solve_parser.add_argument("--output", default="-", help="solutions in input order, '-' for stdout")
+    solve_parser.add_argument("--solver", choices=SOLVERS, default="dlx_solve")
+    solve_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    solve_parser.add_argument("--chunk-size", type=int, default=DEFAULT_SOLVE_CHUNK_SIZE)
+    solve_parser.add_argument("--timeout", type=float, default=None, help="seconds allowed per puzzle")
+    solve_parser.add_argument("--timings", default=None, help="CSV file of per-puzzle status and timings")
+    solve_parser.add_argument("--cache", default=None, help="solution cache file, created if missing")
+    solve_parser.add_argument("--cache-size", type=int, default=100000, help="solutions kept in memory")
+    solve_parser.set_defaults(handler=_cmd_solve)
+
+    grade_parser = commands.add_parser("grade", help="rate puzzles by the techniques they need")
+    grade_parser.add_argument("--input", default="-",
+                              help="file of 81-character lines or packed records, '-' for stdin lines")
+    grade_parser.add_argument("--output", default="-", help="CSV of ratings in input order, '-' for stdout")
+    grade_parser.add_argument("--cache-size", type=int, default=100000, help="ratings kept by canonical form")
+    grade_parser.set_defaults(handler=_cmd_grade)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from collections import Counter
+from collections.abc import Callable
+from sudoku import SudokuState, Difficulty
+from sudoku_render import SudokuRender
+from solve_stats import SolveStats, percentiles
+
+# Fixed puzzle corpus, so numbers stay comparable when the generator changes.
+# 'easy' and 'hard' were produced by SudokuState with random.seed(2024),
+# '17-clue' are minimal puzzles from the public 17-clue collection.
+CORPUS = {
+    "easy": [
+        "100700056097850104065213897071328905048075000352109060000531089539000621014962573",
+        "085000014704105298601489705473908526090570483008640070569201000042090350317804962",
+        "102008634008406120463027089036214895825069410041380760017090248304072051200801000",
+        "025791348000080900839602705000826091962500030501930624310208459450170283208053170",
+        "736108504251964783080735126097080450304059801508400009972000610145806207860210000",
+        "804056020600830951050729684000372509000548312002691470385417296270983045900060030",
+        "143579800798462103500080049980000635620938001010604002051720004436805217270140568",
+        "003090610060701300821056047080400193159803470230179586348002059512937804607504001",
+        "000752000905400320247013068382160904070825631560094002800541276156070403024039815",
+        "341897502806105073500643098907306210068500739210970085089050020600709040034268957",
+    ],
+    "hard": [
+        "090000060005002098402700000000520810008014005150000900004007000007200000010000039",
+        "057240008030000206080000000040900000872006450900500000500060002000000060004002031",
+        "003020080908100002600000005000900004070001030019003800560000210000800090002007050",
+        "980004000070819020040000690000301080010050470000007001006000852002000000000200007",
+        "000000400200801560360000002417600000002059000008300206085060010000000007000004600",
+        "400009062080002000190504007070000040000305206000020008000000003001803000700200510",
+        "000000103600050000079012000795000800300008500180460030040506000000000060000000392",
+        "005096030430001800000400050080000000201009040000087010000900502002000009109000073",
+        "000742030000000140000008006050000004020060980406000003862010070009000068070009000",
+        "100000200000210970085097000010005000004300000500002700042003050006009010030700090",
+    ],
+    "17-clue": [
+        "000000010400000000020000000000050407008000300001090000300400200050100000000806000",
+        "000000010400000000020000000000050604008000300001090000300400200050100000000807000",
+        "000000012000035000000600070700000300000400800100000000000120000080000040050000600",
+        "000000012003600000000007000410020000000500300700000600280000040000300500000000000",
+        "000000012008030000000000040120500000000004700060000000507000300000620000000100000",
+        "000000012040050000000009000070600400000100000000000050000087500601000300200000000",
+        "000000012050400000000000030700600400001000000000080000920000800000510700000003000",
+        "000000012300000060000040000900000500000001070020000000000350400001400800060000000",
+        "000000012400090000000000050070200000600000400000108000018000000000030700502000000",
+        "000000012500008000000700000600120000700000450000030000030000800000500700020000000",
+    ],
+}
+
+SOLVERS: dict[str, Callable[[SudokuState, SolveStats], list[tuple[int, int, int]]]] = {
+    "ord_solve": SudokuState.ord_solve,
+    "opt_solve": SudokuState.opt_solve,
+    "dlx_solve": SudokuState.dlx_solve,
+    "logic_solve": SudokuState.logic_solve,
+}
+
+# (solver, corpus) pairs left out unless --all is given, they take minutes per puzzle
+SLOW = {("ord_solve", "17-clue")}
+
+
+def bench_solvers(repeat: int, include_slow: bool) -> dict[str, dict[str, dict]]:
+    results: dict[str, dict[str, dict]] = {}
+    state = SudokuState()
+    for name, solver in SOLVERS.items():
+        results[name] = {}
+        for corpus, puzzles in CORPUS.items():
+            if (name, corpus) in SLOW and not include_slow:
+                continue
+            samples, nodes, backtracks = [], [], []
+            for _ in range(repeat):
+                for line in puzzles:
+                    state.load(line, Difficulty.HARD)
+                    stats = SolveStats()
+                    start = time.perf_counter()
+                    solution = solver(state, stats)
+                    samples.append(time.perf_counter() - start)
+                    nodes.append(stats.nodes)
+                    backtracks.append(stats.backtracks)
+                    assert len(solution) == state.residual_blank
+            results[name][corpus] = {
+                "seconds": percentiles(samples),
+                "nodes": percentiles(nodes),
+                "backtracks": percentiles(backtracks),
+            }
+    return results
+
+
+def bench_generator(count: int, seed: int) -> dict[str, dict[str, float]]:
+    random.seed(seed)
+    results = {}
+    state = SudokuState()
+    for d in Difficulty:
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            state.restart(d)
+            samples.append(time.perf_counter() - start)
+        results[d.name] = percentiles(samples)
+    return results
+
+
+# stands in for tk.Canvas and counts the item operations the renderer issues
+class CountingCanvas:
+    ops: Counter
+    __next_id: int
+
+    def __init__(self):
+        self.ops = Counter()
+        self.__next_id = 0
+
+    def bind(self, *args):
+        pass
+
+    def __create(self) -> int:
+        self.ops["create"] += 1
+        self.__next_id += 1
+        return self.__next_id
+
+    def create_rectangle(self, *args, **kwargs) -> int:
+        return self.__create()
+
+    def create_text(self, *args, **kwargs) -> int:
+        return self.__create()
+
+    def itemconfig(self, *args, **kwargs):
+        self.ops["itemconfig"] += 1
+
+    def delete(self, *args):
+        self.ops["delete"] += 1
+
+    def update(self):
+        self.ops["update"] += 1
+
+    def take(self) -> dict[str, int]:
+        ops = dict(self.ops)
+        self.ops.clear()
+        return ops
+
+
+def bench_render(repeat: int) -> dict[str, dict]:
+    state = SudokuState()
+    state.load(CORPUS["hard"][0], Difficulty.HARD)
+    canvas = CountingCanvas()
+    render = SudokuRender(canvas, state, cell_size=50, coord=(0, 0),  # type: ignore[arg-type]
+                          cell_color1="#FFFFFF", cell_color2="#FAE067",
+                          cell_color_selected="#FF66FF", cell_color_selected_row="#FF99FF",
+                          cell_color_selected_col="#FF99FF", border_color="#FF8C00",
+                          num_color_fixed="#000000", num_color_valid="#808080", num_color_invalid="#C80000")
+    results: dict[str, dict] = {}
+
+    def measure(name: str, action: Callable[[], None]):
+        start = time.perf_counter()
+        action()
+        render.draw_sudoku()
+        elapsed = time.perf_counter() - start
+        results[name] = {"seconds": elapsed, "ops": canvas.take()}
+
+    measure("first_draw", lambda: None)
+    measure("redraw_unchanged", lambda: None)
+
+    def note_all():
+        for i in range(81):
+            if state.numbers[i] == 0:
+                for n in state.getpossible(i // 9, i % 9):
+                    state.add_note(i // 9, i % 9, n)
+    measure("note_all", note_all)
+
+    # average over many single moves on the board with full notes
+    empties = [i for i in range(81) if state.numbers[i] == 0]
+    samples = []
+    ops = Counter()
+    for k in range(repeat):
+        i = empties[k % len(empties)]
+        start = time.perf_counter()
+        state.set_cell(i // 9, i % 9, k % 9 + 1)
+        render.draw_sudoku()
+        state.clr_cell(i // 9, i % 9)
+        render.draw_sudoku()
+        samples.append(time.perf_counter() - start)
+        ops.update(canvas.take())
+    results["move_and_undo"] = {"seconds": percentiles(samples),
+                                "ops_per_move": {op: n / repeat for op, n in ops.items()}}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark", description="headless sudoku benchmarks, JSON output")
+    parser.add_argument("--only", choices=["solve", "generate", "render"], action="append",
+                        help="run only these benchmarks (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the solver corpus")
+    parser.add_argument("--generate-count", type=int, default=50, help="puzzles generated per difficulty")
+    parser.add_argument("--render-moves", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--all", action="store_true", help="include the very slow solver/corpus pairs")
+    parser.add_argument("--output", default="-", help="output file, '-' for stdout")
+    args = parser.parse_args(argv)
+    only = set(args.only or ["solve", "generate", "render"])
+
+    report: dict[str, object] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "seed": args.seed,
+    }
+    if "solve" in only:
+        report["solve"] = bench_solvers(args.repeat, args.all)
+    if "generate" in only:
+        report["generate"] = bench_generator(args.generate_count, args.seed)
+    if "render" in only:
+        report["render"] = bench_render(args.render_moves)
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    with open(args.output, "w") as out:
+        json.dump(report, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,39 @@
 from collections.abc import Callable
+import threading
 import tkinter as tk
 from sudoku import SudokuState, Difficulty
 from sudoku_render import SudokuRender
+from solve_cache import SolveCache
+from prefetch import PuzzlePrefetcher
+from history_view import HistoryView
+from journal import GameHistory, Edit, SET_VALUE, ADD_NOTE, CLEAR_NOTES, FILL_ALL_NOTES
 from typing import Optional, Literal
-import time
-
-# (row, col, old_value, new_value)
-SudokuOperation = tuple[int, int, Optional[int], Optional[int]]
 
 difficulty_options = [d.name for d in Difficulty]
 difficulty_map = { d.name: d for d in Difficulty }
 
-GameState = Literal["running", "complete", "auto"]
+# "loading": waiting for the prefetcher, the board on screen is read-only
+GameState = Literal["running", "complete", "auto", "loading"]
+
+Solution = list[tuple[int, int, int]]
+
+# delay between two auto-solve steps, in milliseconds
+auto_speed_options = {"慢速": 1000, "中速": 500, "快速": 100, "极速": 10}
+
+# how often buffered journal records are forced to disk, in milliseconds
+journal_sync_interval = 1000
 
 class Controller:
     root: tk.Tk
     sudoku: SudokuState
     sudoku_render: SudokuRender
-    op_stack: list[SudokuOperation]
-    op_stack_listbox: tk.Listbox
+    # every edit of the current game; undone ones stay until a new edit
+    history: GameHistory
+    history_view: HistoryView
     buttons_number: list[tk.Button]
     button_clear: tk.Button
     button_undo: tk.Button
+    button_redo: tk.Button
     button_note: tk.Button
     button_note_all: tk.Button
     button_hint: tk.Button
@@ -31,28 +43,71 @@ class Controller:
     label_timer: tk.Label
     timer_id: Optional[str]
     label_game_state: tk.Label
+    label_hint: tk.Label
     time: int
     do_noting: bool
     game_state: GameState
-
-    def __init__(self, root, sudoku, sudoku_render, /, cell_size, bg: str, coord: tuple[int, int]):
+    # auto-solve playback: the solver runs on a copy of the board in a worker
+    # thread, then the solution is played back one step per 'auto_delay' ms
+    auto_token: int
+    auto_job: Optional[str]
+    auto_solution: Optional[Solution]
+    auto_index: int
+    auto_paused: bool
+    auto_skip: bool
+    auto_delay: tk.IntVar
+    solve_cache: Optional[SolveCache]
+    # with a prefetcher, restart takes ready puzzles from it and never
+    # generates on the Tk thread
+    prefetcher: Optional[PuzzlePrefetcher]
+    restart_job: Optional[str]
+
+    # with a prefetcher the first puzzle is requested right away, so
+    # 'sudoku' can start out as an empty board. A 'history' that already
+    # holds a game (see GameHistory.resume) continues that game instead.
+    def __init__(self, root, sudoku, sudoku_render, /, cell_size, bg: str, coord: tuple[int, int],
+                 solve_cache: Optional[SolveCache] = None, prefetcher: Optional[PuzzlePrefetcher] = None,
+                 history: Optional[GameHistory] = None):
         self.root = root
         self.sudoku = sudoku
         self.sudoku_render = sudoku_render
+        self.solve_cache = solve_cache
+        self.prefetcher = prefetcher
+        self.restart_job = None
         self.do_noting = False
         self.game_state = "running"
-        self.op_stack = []
-        self.op_stack_listbox = tk.Listbox(root, font=("Consolas", cell_size // 4), selectmode=tk.NONE)
-        self.op_stack_listbox.bind("<Button-1>", lambda _: "break")
+        self.history = history if history is not None else GameHistory()
+        self.auto_token = 0
+        self.auto_job = None
+        self.auto_solution = None
+        self.auto_index = 0
+        self.auto_paused = False
+        self.auto_skip = False
+        self.auto_delay = tk.IntVar(root, value=auto_speed_options["中速"])
+        self.history_view = HistoryView(root, self.history, rows=10, font=("Consolas", cell_size // 4),
+                                        on_jump=lambda position: self.__jump(position))
         self.__init_controls(root, cell_size, bg, coord)
         self.__init_menu_bar(root)
+        if self.history.has_game():
+            self.selected_restart_option.set(sudoku.difficulty.name)
+            self.history_view.reset()
+            if sudoku.is_solved():
+                self.__set_game_state("complete")
+        elif prefetcher is not None:
+            self.__restart()
+        else:
+            self.history.start(sudoku)
+        self.root.after(journal_sync_interval, lambda: self.__sync_history())
 
     def __init_controls(self, root, cell_size, bg, coord):
         self.label_game_state = tk.Label(root, text="", bg=bg, font=("hei", cell_size // 2))
+        self.label_hint = tk.Label(root, text="", bg=bg, font=("hei", cell_size // 4),
+                                   wraplength=6 * cell_size, justify="left", anchor="nw")
         self.buttons_number = [tk.Button(root, text=number, command=self.__get_handler_on_click_number(number))
                                for number in range(1, 10)]
         self.button_clear = tk.Button(root, text="清除", command=lambda: self.__clear())
         self.button_undo = tk.Button(root, text="撤销", command=lambda: self.__undo())
+        self.button_redo = tk.Button(root, text="重做", command=lambda: self.__redo())
         self.button_note = tk.Button(root, text="笔记", command=lambda: self.__note())
         self.button_note_all = tk.Button(root, text="一键笔记", command=lambda: self.__note_all())
         self.button_hint = tk.Button(root, text="提示", command=lambda: self.__hint())
@@ -66,12 +121,13 @@ class Controller:
         self.__update_time()
 
         (x, y) = coord
-        self.op_stack_listbox.place(x=x + 10 * cell_size, y=y, width=6 * cell_size, height=5 * cell_size)
+        self.history_view.place(x=x + 10 * cell_size, y=y, width=6 * cell_size, query_height=cell_size // 2)
+        self.label_hint.place(x=x + 10 * cell_size, y=y + 5 * cell_size, width=6 * cell_size, height=3 * cell_size // 2)
         self.label_game_state.place(x=x + 13 * cell_size, y=y + 7 * cell_size, anchor="center")
         y += 10 * cell_size
         for i, button in enumerate(self.buttons_number):
             button.place(x=x + i * cell_size, y=y + cell_size, width=cell_size, height=cell_size)
-        control_buttons = [self.button_clear, self.button_undo,
+        control_buttons = [self.button_clear, self.button_undo, self.button_redo,
                            self.button_note, self.button_note_all,
                            self.button_hint, self.button_restart,
                            self.option_difficulty]
@@ -82,27 +138,133 @@ class Controller:
         x += non_number_button_width
         self.label_timer.place(x=x, y=y)
 
-    def __show_solution(self, solution: list[tuple[int, int, int]]):
-        if self.__game_is_complete():
+    # run 'solver' on a copy of the board off the Tk thread, then play the solution back
+    # 'solver' gets the board copy and a callable telling it the run was cancelled
+    def __start_auto_solve(self, solver: Callable[[SudokuState, Callable[[], bool]], Solution]):
+        if not self.__game_is_running():
             return
 
         self.__set_game_state("auto")
         self.do_noting = False
-
-        for (row, col, val) in solution:
+        self.button_note.config(relief="raised")
+        self.auto_token += 1
+        self.auto_paused = False
+        self.auto_skip = False
+
+        token = self.auto_token
+        board = self.sudoku.copy()
+        result: list[Solution] = []
+        worker = threading.Thread(target=lambda: result.append(solver(board, lambda: self.auto_token != token)),
+                                  daemon=True)
+        worker.start()
+        self.__wait_for_solution(token, worker, result)
+
+    # poll the solver thread, Tk must not be touched from the worker itself
+    def __wait_for_solution(self, token: int, worker: threading.Thread, result: list[Solution]):
+        if token != self.auto_token:
+            # cancelled, drop whatever the worker comes up with
+            return
+        if worker.is_alive():
+            self.auto_job = self.root.after(50, lambda: self.__wait_for_solution(token, worker, result))
+            return
+        self.auto_job = None
+        self.__show_solution(result[0] if len(result) != 0 else [])
+
+    def __show_solution(self, solution: Solution):
+        self.auto_solution = solution
+        self.auto_index = 0
+        if self.auto_skip:
+            self.__skip_auto()
+        elif not self.auto_paused:
+            self.__auto_step()
+
+    def __auto_step(self):
+        self.auto_job = None
+        solution = self.auto_solution
+        assert solution is not None
+        if self.auto_index < len(solution) and not self.__game_is_complete():
+            (row, col, val) = solution[self.auto_index]
+            self.auto_index += 1
             self.__set_answer(row, col, val)
             self.sudoku_render.draw_sudoku()
-            time.sleep(0.5)
 
+        if self.auto_index >= len(solution) or self.__game_is_complete():
+            self.__finish_auto()
+            return
+        self.auto_job = self.root.after(self.auto_delay.get(), lambda: self.__auto_step())
+
+    def __finish_auto(self):
+        if self.auto_job is not None:
+            self.root.after_cancel(self.auto_job)
+        self.auto_job = None
+        self.auto_solution = None
+        self.auto_paused = False
+        self.auto_skip = False
         if not self.__game_is_complete():
             self.__set_game_state("running")
 
+    def __pause_auto(self):
+        if not self.__game_is_auto():
+            return
+        self.auto_paused = not self.auto_paused
+        self.label_game_state.config(text="已暂停" if self.auto_paused else "自动求解中")
+        if self.auto_solution is None:
+            # still solving, the playback starts paused or not once the solution arrives
+            return
+        if self.auto_paused:
+            if self.auto_job is not None:
+                self.root.after_cancel(self.auto_job)
+                self.auto_job = None
+        elif self.auto_job is None:
+            self.__auto_step()
+
+    def __cancel_auto(self):
+        if not self.__game_is_auto():
+            return
+        self.auto_token += 1
+        self.__finish_auto()
+
+    def __skip_auto(self):
+        if not self.__game_is_auto():
+            return
+        if self.auto_solution is None:
+            # still solving, skip as soon as the solution arrives
+            self.auto_skip = True
+            return
+        for (row, col, val) in self.auto_solution[self.auto_index:]:
+            if self.__game_is_complete():
+                break
+            self.__set_answer(row, col, val)
+        self.auto_index = len(self.auto_solution)
+        self.sudoku_render.draw_sudoku()
+        self.__finish_auto()
+
+    # runs on the solver thread
+    def __cached_solve(self, board: SudokuState, solver: str, cancelled: Callable[[], bool]) -> Solution:
+        if self.solve_cache is None:
+            return getattr(board, solver)(should_stop=cancelled)
+        return self.solve_cache.solve(board, solver, should_stop=cancelled)
 
     def __init_menu_bar(self, root):
         menu_bar = tk.Menu(root)
         solver_menu = tk.Menu(menu_bar)
-        solver_menu.add_command(label="顺序求解", command=lambda: self.__show_solution(self.sudoku.ord_solve()))
-        solver_menu.add_command(label="优化求解", command=lambda: self.__show_solution(self.sudoku.opt_solve()))
+        solver_menu.add_command(label="顺序求解", command=lambda: self.__start_auto_solve(
+            lambda board, cancelled: self.__cached_solve(board, "ord_solve", cancelled)))
+        solver_menu.add_command(label="优化求解", command=lambda: self.__start_auto_solve(
+            lambda board, cancelled: self.__cached_solve(board, "opt_solve", cancelled)))
+        solver_menu.add_command(label="DLX求解", command=lambda: self.__start_auto_solve(
+            lambda board, cancelled: self.__cached_solve(board, "dlx_solve", cancelled)))
+        # not cached: the playback follows the order of the deductions
+        solver_menu.add_command(label="逻辑求解", command=lambda: self.__start_auto_solve(
+            lambda board, cancelled: board.logic_solve(should_stop=cancelled)))
+        solver_menu.add_separator()
+        solver_menu.add_command(label="暂停/继续", command=lambda: self.__pause_auto())
+        solver_menu.add_command(label="跳到结尾", command=lambda: self.__skip_auto())
+        solver_menu.add_command(label="取消", command=lambda: self.__cancel_auto())
+        speed_menu = tk.Menu(solver_menu)
+        for label, delay in auto_speed_options.items():
+            speed_menu.add_radiobutton(label=label, variable=self.auto_delay, value=delay)
+        solver_menu.add_cascade(label="速度", menu=speed_menu)
         menu_bar.add_cascade(label="自动求解", menu=solver_menu)
         root.config(menu=menu_bar)
 
@@ -126,27 +288,37 @@ class Controller:
     def __game_is_complete(self):
         return self.game_state == "complete"
 
+    def __game_is_loading(self):
+        return self.game_state == "loading"
+
     def __set_game_state(self, state: GameState):
         self.game_state = state
         msg_map = {
             "running": "",
             "auto": "自动求解中",
             "complete": "游戏结束",
+            "loading": "生成中",
         }
         self.label_game_state.config(text=msg_map[state])
 
-    def __op_stack_pop(self) -> SudokuOperation:
-        self.op_stack_listbox.delete(tk.END)
-        return self.op_stack.pop()
+    # apply 'edit' through the history; the edits it drops leave the view too
+    def __record(self, edit: Edit):
+        position = self.history.cursor
+        self.history.record(self.sudoku, edit)
+        self.history_view.edits_changed(position)
+
+    def __history_moved(self):
+        self.history_view.cursor_moved()
+        if self.sudoku.is_solved():
+            self.__set_game_state("complete")
 
-    def __op_stack_push(self, op: SudokuOperation):
-        self.op_stack_listbox.insert(tk.END, f"{len(self.op_stack) + 1:<4} ({op[0]}, {op[1]}) {op[2]} -> {op[3]}")
-        self.op_stack.append(op)
-        self.op_stack_listbox.see(tk.END) 
+    def __sync_history(self):
+        self.history.sync()
+        self.root.after(journal_sync_interval, lambda: self.__sync_history())
 
     def __set_answer(self, row, col, number):
-        self.__op_stack_push((row, col, self.sudoku.get_cell(row, col).number, number))
-        self.sudoku.set_cell(row, col, number)
+        old = self.sudoku.get_cell(row, col).number
+        self.__record(Edit(SET_VALUE, row, col, old or 0, number))
         if self.sudoku.is_solved():
             self.__set_game_state("complete")
 
@@ -159,7 +331,7 @@ class Controller:
                 return
             (row, col) = selected
             if self.do_noting:
-                self.sudoku.add_note(row, col, number)
+                self.__record(Edit(ADD_NOTE, row, col, 0, number))
             else:
                 self.__set_answer(row, col, number)
 
@@ -173,25 +345,36 @@ class Controller:
         if selected is None:
             return
         (row, col) = selected
+        cell = self.sudoku.get_cell(row, col)
+        # clearing what is already empty would only pad the history
         if self.do_noting:
-            self.sudoku.clr_note(row, col)
-        else:
-            self.__op_stack_push((row, col, self.sudoku.get_cell(row, col).number, None))
-            self.sudoku.clr_cell(row, col)
+            if len(cell.notes) != 0:
+                self.__record(Edit(CLEAR_NOTES, row, col))
+        elif cell.number is not None:
+            self.__record(Edit(SET_VALUE, row, col, cell.number, 0))
 
         self.sudoku_render.draw_sudoku()
 
     def __undo(self):
-        if not self.__game_is_running():
+        if not self.__game_is_running() or not self.history.can_undo():
             return
-        if len(self.op_stack) == 0:
+        self.history.undo(self.sudoku)
+        self.__history_moved()
+        self.sudoku_render.draw_sudoku()
+
+    def __redo(self):
+        if not self.__game_is_running() or not self.history.can_redo():
             return
-        (row, col, old_value, _) = self.__op_stack_pop()
-        if old_value is None:
-            self.sudoku.clr_cell(row, col)
-        else:
-            self.sudoku.set_cell(row, col, old_value)
+        self.history.redo(self.sudoku)
+        self.__history_moved()
+        self.sudoku_render.draw_sudoku()
 
+    # go to the board right after edit number 'position' (1-based)
+    def __jump(self, position: int):
+        if not self.__game_is_running() or position > len(self.history):
+            return
+        self.history.seek(self.sudoku, position)
+        self.__history_moved()
         self.sudoku_render.draw_sudoku()
 
     def __note(self):
@@ -200,44 +383,70 @@ class Controller:
         self.do_noting = not self.do_noting
         self.button_note.config(relief="sunken" if self.do_noting else "raised")
 
-    def __add_all_possible_to_note(self, row, col):
-        self.sudoku.clr_note(row, col)
-        for n in self.sudoku.getpossible(row, col):
-            self.sudoku.add_note(row, col, n)
-
     def __note_all(self):
         if not self.__game_is_running():
             return
-        for r in range(9):
-            for c in range(9):
-                if self.sudoku.get_cell(r, c).isfixed():
-                    continue
-                self.__add_all_possible_to_note(r, c)
+        self.__record(Edit(FILL_ALL_NOTES, 0, 0))
         self.sudoku_render.draw_sudoku()
                 
     def __hint(self):
         if not self.__game_is_running():
             return
-        selected = self.sudoku_render.get_selected()
-        if selected is None:
+        steps = self.sudoku.hint()
+        if len(steps) == 0:
+            self.label_hint.config(text="没有可用的提示")
             return
-        (row, col) = selected
-        self.__add_all_possible_to_note(row, col)
+        # the placement first, so a long chain of eliminations never hides it
+        step = steps[-1]
+        size = self.sudoku.size
+        self.label_hint.config(text="\n".join(s.describe(size) for s in [step] + steps[:-1]))
+        target = step.placement[0] if step.placement is not None else step.eliminations[0][0]
+        self.sudoku_render.select(target // 9, target % 9)
         self.sudoku_render.draw_sudoku()
 
-    def __restart_timer(self):
+    def __stop_timer(self):
         if self.timer_id is not None:
             self.root.after_cancel(self.timer_id)
+            self.timer_id = None
+
+    def __restart_timer(self):
+        self.__stop_timer()
         self.time = -1
         self.__update_time()
 
     def __restart(self):
         if self.__game_is_auto():
             return
+        difficulty = difficulty_map[self.selected_restart_option.get()]
+        if self.prefetcher is None:
+            self.sudoku.restart(difficulty)
+            self.__start_game()
+            return
+        if self.restart_job is not None:
+            # a newer restart replaces the one still waiting
+            self.root.after_cancel(self.restart_job)
+            self.restart_job = None
+        self.__wait_for_puzzle(difficulty)
+
+    # poll the prefetcher until a puzzle is ready, keeping the window responsive
+    def __wait_for_puzzle(self, difficulty: Difficulty):
+        assert self.prefetcher is not None
+        line = self.prefetcher.draw(difficulty)
+        if line is None:
+            if not self.__game_is_loading():
+                self.__set_game_state("loading")
+                self.__stop_timer()
+            self.restart_job = self.root.after(50, lambda: self.__wait_for_puzzle(difficulty))
+            return
+        self.restart_job = None
+        self.sudoku.load(line, difficulty)
+        self.__start_game()
+
+    def __start_game(self):
         self.__set_game_state("running")
         self.do_noting = False
-        self.sudoku.restart(difficulty_map[self.selected_restart_option.get()])
         self.sudoku_render.restart()
-        self.op_stack.clear()
-        self.op_stack_listbox.delete(0, tk.END)
+        self.history.start(self.sudoku)
+        self.history_view.reset()
+        self.label_hint.config(text="")
         self.__restart_timer()
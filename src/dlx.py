@@ -0,0 +1,193 @@
+from collections.abc import Callable, Iterator, Sequence
+from typing import Optional
+from solve_stats import SolveStats, STOP_POLL_INTERVAL
+from geometry import Geometry, STANDARD
+
+
+# Knuth's Algorithm X over a sparse 0/1 matrix stored as toroidal doubly
+# linked lists. Nodes live in parallel integer lists; node 0 is the root
+# header and nodes 1..ncolumns are the column headers.
+class DancingLinks:
+    left: list[int]
+    right: list[int]
+    up: list[int]
+    down: list[int]
+    column: list[int]
+    row_id: list[int]
+    size: list[int]
+
+    def __init__(self, ncolumns: int):
+        headers = range(ncolumns + 1)
+        self.left = [i - 1 for i in headers]
+        self.left[0] = ncolumns
+        self.right = [i + 1 for i in headers]
+        self.right[ncolumns] = 0
+        self.up = list(headers)
+        self.down = list(headers)
+        self.column = list(headers)
+        self.row_id = [-1] * (ncolumns + 1)
+        self.size = [0] * (ncolumns + 1)
+
+    # append a row covering the given (0-based) columns
+    def add_row(self, row_id: int, columns: Sequence[int]):
+        first = len(self.left)
+        for i, col in enumerate(columns):
+            header = col + 1
+            node = first + i
+            self.left.append(node - 1 if i > 0 else first + len(columns) - 1)
+            self.right.append(node + 1 if i < len(columns) - 1 else first)
+            self.up.append(self.up[header])
+            self.down.append(header)
+            self.down[self.up[header]] = node
+            self.up[header] = node
+            self.column.append(header)
+            self.row_id.append(row_id)
+            self.size[header] += 1
+
+    def __cover(self, col: int):
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        right[left[col]] = right[col]
+        left[right[col]] = left[col]
+        i = down[col]
+        while i != col:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def __uncover(self, col: int):
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        i = up[col]
+        while i != col:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[col]] = col
+        left[right[col]] = col
+
+    def __choose_column(self) -> int:
+        # the column with the fewest remaining rows (Knuth's S heuristic)
+        right, size = self.right, self.size
+        best, best_size = 0, -1
+        col = right[0]
+        while col != 0:
+            if best_size < 0 or size[col] < best_size:
+                best, best_size = col, size[col]
+                if best_size <= 1:
+                    break
+            col = right[col]
+        return best
+
+    # yield every exact cover as a list of row ids. The search ends early,
+    # with stats.cancelled set, once 'should_stop' returns True.
+    def search(self, stats: Optional[SolveStats] = None,
+               should_stop: Optional[Callable[[], bool]] = None) -> Iterator[list[int]]:
+        partial: list[int] = []
+        yield from self.__search_aux(partial, stats if stats is not None else SolveStats(), should_stop)
+
+    def __search_aux(self, partial: list[int], stats: SolveStats,
+                     should_stop: Optional[Callable[[], bool]]) -> Iterator[list[int]]:
+        if self.right[0] == 0:
+            yield list(partial)
+            return
+
+        col = self.__choose_column()
+        stats.candidate_computations += 1
+        if self.size[col] == 0:
+            return
+
+        self.__cover(col)
+        r = self.down[col]
+        while r != col:
+            partial.append(self.row_id[r])
+            stats.node(len(partial))
+            if should_stop is not None and stats.nodes % STOP_POLL_INTERVAL == 0 and should_stop():
+                stats.cancelled = True
+            if stats.cancelled:
+                # leave the links as they are, the matrix is not used again
+                return
+            j = self.right[r]
+            while j != r:
+                self.__cover(self.column[j])
+                j = self.right[j]
+
+            yield from self.__search_aux(partial, stats, should_stop)
+            if stats.cancelled:
+                return
+
+            j = self.left[r]
+            while j != r:
+                self.__uncover(self.column[j])
+                j = self.left[j]
+            partial.pop()
+            stats.backtrack()
+            r = self.down[r]
+        self.__uncover(col)
+
+
+# exact cover columns of a sudoku: each cell holds one digit, and each
+# row, column and box holds each digit once
+def _constraint_columns(g: Geometry, i: int, n: int) -> tuple[int, int, int, int]:
+    size, ncells = g.size, g.ncells
+    return (i,
+            ncells + g.row_of[i] * size + n - 1,
+            2 * ncells + g.col_of[i] * size + n - 1,
+            3 * ncells + g.box_of[i] * size + n - 1)
+
+
+def _build(numbers: Sequence[int], g: Geometry) -> Optional[DancingLinks]:
+    satisfied = set()
+    for i, n in enumerate(numbers):
+        if n == 0:
+            continue
+        columns = _constraint_columns(g, i, n)
+        if any(col in satisfied for col in columns):
+            # two givens conflict, there is no solution
+            return None
+        satisfied.update(columns)
+
+    # drop the constraints already met by the givens and renumber the rest
+    remap = {}
+    for col in range(4 * g.ncells):
+        if col not in satisfied:
+            remap[col] = len(remap)
+
+    dlx = DancingLinks(len(remap))
+    for i, n in enumerate(numbers):
+        if n != 0:
+            continue
+        for digit in g.digits():
+            columns = _constraint_columns(g, i, digit)
+            if any(col in satisfied for col in columns):
+                continue
+            dlx.add_row(i * g.size + digit - 1, [remap[col] for col in columns])
+    return dlx
+
+
+# yield the completed grids of a puzzle given as its numbers in row-major
+# order, with 0 for an empty cell
+def solve_sudoku(numbers: Sequence[int], stats: Optional[SolveStats] = None,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 geometry: Geometry = STANDARD) -> Iterator[list[int]]:
+    stats = stats if stats is not None else SolveStats()
+    with stats.phase("build"):
+        dlx = _build(numbers, geometry)
+    if dlx is None:
+        return
+    search = dlx.search(stats, should_stop)
+    while True:
+        with stats.phase("search"):
+            rows = next(search, None)
+        if rows is None:
+            return
+        grid = list(numbers)
+        for row_id in rows:
+            grid[row_id // geometry.size] = row_id % geometry.size + 1
+        yield grid
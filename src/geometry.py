@@ -0,0 +1,98 @@
+from array import array
+from functools import cache
+from typing import Optional, Union
+
+# characters of the numbers 0..35 in puzzle lines: '0' for an empty cell,
+# then '1'..'9' and 'A'..'Z', so a 9x9 line reads as usual
+DIGIT_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+MaskArray = Union[array, list[int]]
+
+
+# Layout of a board of 'box' x 'box' boxes: 'size' = box * box rows,
+# columns, boxes and digits, and size * size cells in row-major order.
+# Units 0..size-1 are the rows, then the columns, then the boxes.
+# Digit sets are int bitmasks with bit n standing for digit n, so they
+# stay plain integer operations whatever the number of digits.
+class Geometry:
+    box: int
+    size: int
+    ncells: int
+    # bit n is set for every digit n in 1..size
+    all_digits: int
+    # bit i is set for every cell index i
+    all_cells: int
+    # unit indices of each cell
+    row_of: list[int]
+    col_of: list[int]
+    box_of: list[int]
+    units: list[list[int]]
+    # the row, column and box unit of each cell
+    cell_units: list[tuple[int, int, int]]
+    # the other cells sharing a unit with each cell
+    peers: list[list[int]]
+    # array type code wide enough for a digit bitmask, None when only a
+    # list of ints will do (more than 63 digits)
+    mask_typecode: Optional[str]
+
+    def __init__(self, box: int):
+        self.box = box
+        self.size = size = box * box
+        self.ncells = size * size
+        self.all_digits = (1 << (size + 1)) - 2
+        self.all_cells = (1 << self.ncells) - 1
+        self.row_of = [i // size for i in range(self.ncells)]
+        self.col_of = [i % size for i in range(self.ncells)]
+        self.box_of = [self.box_index(i // size, i % size) for i in range(self.ncells)]
+        self.units = ([[r * size + c for c in range(size)] for r in range(size)]
+            + [[r * size + c for r in range(size)] for c in range(size)]
+            + [[(box * (b // box) + k // box) * size + box * (b % box) + k % box for k in range(size)]
+               for b in range(size)])
+        self.cell_units = [(self.row_of[i], size + self.col_of[i], 2 * size + self.box_of[i])
+                           for i in range(self.ncells)]
+        self.peers = [sorted({j for u in self.cell_units[i] for j in self.units[u]} - {i})
+                      for i in range(self.ncells)]
+        self.mask_typecode = next((code for code in ("H", "L", "Q") if array(code).itemsize * 8 > size), None)
+
+    def box_index(self, row: int, col: int) -> int:
+        return self.box * (row // self.box) + col // self.box
+
+    def digits(self) -> range:
+        return range(1, self.size + 1)
+
+    # a zeroed digit bitmask per cell
+    def new_masks(self) -> MaskArray:
+        if self.mask_typecode is None:
+            return [0] * self.ncells
+        return array(self.mask_typecode, bytes(array(self.mask_typecode).itemsize * self.ncells))
+
+    def parse_line(self, line: str) -> list[int]:
+        if len(line) != self.ncells:
+            raise ValueError(f"expected {self.ncells} characters, got {len(line)}")
+        numbers = [0 if ch == "." else DIGIT_CHARS.find(ch.upper()) for ch in line]
+        if any(n < 0 or n > self.size for n in numbers):
+            raise ValueError(f"not a {self.size}x{self.size} puzzle: {line}")
+        return numbers
+
+    def format_line(self, numbers) -> str:
+        return "".join(DIGIT_CHARS[n] for n in numbers)
+
+
+@cache
+def geometry(box: int) -> Geometry:
+    if not 2 <= box <= 5:
+        # line format digits run out past 35
+        raise ValueError(f"box size must be between 2 and 5, got {box}")
+    return Geometry(box)
+
+
+# the geometry of a puzzle line of 'ncells' characters
+def geometry_for_cells(ncells: int) -> Geometry:
+    for box in range(2, 6):
+        if box ** 4 == ncells:
+            return geometry(box)
+    raise ValueError(f"{ncells} cells is not a square board of square boxes")
+
+
+# the classic 9x9 board
+STANDARD = geometry(3)
@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import NamedTuple, Optional
+from sudoku import SudokuState, Difficulty
+from geometry import Geometry, STANDARD, geometry_for_cells
+from solve_stats import SolveStats
+from symmetry import canonical_form
+import logic
+
+# Rates a puzzle by the hardest technique a human needs for it: deductions
+# are applied cheapest first (logic.next_step), so a harder technique only
+# counts when nothing easier was available at that point. A puzzle that
+# gets stuck needs guessing, and the search nodes to finish it from there
+# measure how much. The level is the same for every symmetric variant of
+# a puzzle; the technique named for a level shared by two (pointing and
+# claiming) and the step and node counts may differ a little between them.
+
+# how hard each technique is to spot, higher is harder
+TECHNIQUE_LEVELS = {
+    "naked_single": 0,
+    "hidden_single": 1,
+    "pointing": 2,
+    "claiming": 2,
+    "naked_pair": 3,
+    "hidden_pair": 4,
+}
+# deductions alone get stuck
+GUESS_LEVEL = 5
+
+# the (least, most) level of the puzzles of each difficulty
+DIFFICULTY_BANDS = {
+    Difficulty.EASY: (0, 1),
+    Difficulty.NORMAL: (2, 4),
+    Difficulty.HARD: (GUESS_LEVEL, GUESS_LEVEL),
+}
+# the blank count candidates are generated with for each difficulty. Boards
+# with the blank count of the difficulty itself land in its band too rarely
+# (about one in seven 54-blank boards needs pairs or locked candidates).
+CANDIDATE_DIFFICULTY = {
+    Difficulty.EASY: Difficulty.NORMAL,
+    Difficulty.NORMAL: Difficulty.HARD,
+    Difficulty.HARD: Difficulty.HARD,
+}
+# candidates generate() tries before settling for the closest one
+DEFAULT_MAX_TRIES = 50
+
+
+class Rating(NamedTuple):
+    # level of the hardest technique needed, GUESS_LEVEL when stuck
+    level: int
+    # the first technique of that level used, "guess" when stuck and
+    # "none" for a board needing no deduction at all
+    technique: str
+    # deductions made before the board was solved or stuck
+    steps: int
+    # search nodes needed after getting stuck, 0 without guessing
+    nodes: int
+    # False when rating stopped at the first step harder than allowed;
+    # 'level' is then a lower bound and the counts are partial
+    complete: bool = True
+
+
+def difficulty_of(rating: Rating) -> Difficulty:
+    return next(d for d, (least, most) in DIFFICULTY_BANDS.items() if least <= rating.level <= most)
+
+
+# rate 'numbers', giving up as soon as a step harder than 'max_level' is
+# needed. Raises ValueError if the puzzle has no solution.
+def rate(numbers: Sequence[int], max_level: int = GUESS_LEVEL, geometry: Geometry = STANDARD) -> Rating:
+    board = logic.LogicBoard(numbers, geometry)
+    level = 0
+    technique = "none"
+    steps = 0
+    while not board.broken:
+        step = logic.next_step(board)
+        if step is None:
+            break
+        step_level = TECHNIQUE_LEVELS[step.technique]
+        if step_level > max_level:
+            return Rating(step_level, step.technique, steps, 0, False)
+        if steps == 0 or step_level > level:
+            level, technique = step_level, step.technique
+        board.apply(step)
+        steps += 1
+    if board.broken:
+        raise ValueError("puzzle has no solution")
+    if board.is_complete():
+        return Rating(level, technique, steps, 0)
+    if max_level < GUESS_LEVEL:
+        return Rating(GUESS_LEVEL, "guess", steps, 0, False)
+    stats = SolveStats()
+    if logic.solve(board.numbers, stats, geometry=geometry) is None:
+        raise ValueError("puzzle has no solution")
+    return Rating(GUESS_LEVEL, "guess", steps, stats.nodes)
+
+
+# Rates puzzles with the complete ratings of 9x9 boards kept in an LRU keyed
+# by canonical form (symmetry.canonical_form), since the rating is the same
+# for every board of an orbit. Safe to share between threads.
+class Grader:
+    max_entries: int
+    hits: int
+    misses: int
+    lock: threading.Lock
+    __ratings: OrderedDict[bytes, Rating]
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.__ratings = OrderedDict()
+
+    def rate(self, line: str, max_level: int = GUESS_LEVEL) -> Rating:
+        geometry = geometry_for_cells(len(line))
+        numbers = geometry.parse_line(line)
+        if geometry is not STANDARD:
+            return rate(numbers, max_level, geometry)
+        key, _ = canonical_form(numbers)
+        with self.lock:
+            rating = self.__ratings.get(key)
+            if rating is not None:
+                self.__ratings.move_to_end(key)
+                self.hits += 1
+                return rating
+            self.misses += 1
+        rating = rate(numbers, max_level)
+        if rating.complete:
+            with self.lock:
+                self.__ratings[key] = rating
+                while len(self.__ratings) > self.max_entries:
+                    self.__ratings.popitem(last=False)
+        return rating
+
+    # whether 'line' falls in the band of 'difficulty'; stops at the first
+    # step too hard for it
+    def matches(self, line: str, difficulty: Difficulty) -> bool:
+        (least, most) = DIFFICULTY_BANDS[difficulty]
+        rating = self.rate(line, most)
+        return rating.complete and least <= rating.level <= most
+
+    # a new puzzle rated in the band of 'difficulty'. Candidates that turn
+    # out too hard are dropped at their first step beyond the band; after
+    # 'max_tries' the closest candidate is returned, so the cost is bounded.
+    def generate(self, difficulty: Difficulty, max_tries: int = DEFAULT_MAX_TRIES) -> str:
+        (least, most) = DIFFICULTY_BANDS[difficulty]
+        best: Optional[tuple[int, str]] = None
+        for _ in range(max_tries):
+            line = SudokuState(CANDIDATE_DIFFICULTY[difficulty]).to_line()
+            rating = self.rate(line, most)
+            if rating.complete and least <= rating.level <= most:
+                return line
+            distance = least - rating.level if rating.level < least else rating.level - most
+            if best is None or distance < best[0]:
+                best = (distance, line)
+        assert best is not None
+        return best[1]
+
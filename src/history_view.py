@@ -0,0 +1,227 @@
+import tkinter as tk
+from bisect import bisect_left
+from collections.abc import Callable
+from typing import Optional
+from journal import GameHistory, Edit, SET_VALUE, ADD_NOTE, CLEAR_NOTES, FILL_ALL_NOTES
+
+EditPredicate = Callable[[Edit], bool]
+
+# the words free text is matched against, per edit kind, so a search never
+# has to format the rows it tests
+KIND_WORDS = {
+    SET_VALUE: "填数",
+    ADD_NOTE: "笔记 添加笔记",
+    CLEAR_NOTES: "笔记 清除笔记",
+    FILL_ALL_NOTES: "笔记 一键笔记",
+}
+
+
+def _token_predicate(token: str) -> EditPredicate:
+    if token == "填数":
+        return lambda edit: edit.kind == SET_VALUE
+    if token == "笔记":
+        return lambda edit: edit.kind != SET_VALUE
+    if len(token) > 1 and token[0] in "rRcC" and token[1:].isdigit():
+        n = int(token[1:])
+        if token[0] in "rR":
+            return lambda edit: edit.kind != FILL_ALL_NOTES and edit.row == n
+        return lambda edit: edit.kind != FILL_ALL_NOTES and edit.col == n
+    if token.isdigit():
+        n = int(token)
+        return lambda edit: n != 0 and n in (edit.old, edit.new)
+    kinds = {kind for kind, words in KIND_WORDS.items() if token in words}
+    return lambda edit: edit.kind in kinds
+
+
+# the edits a search matches, None for an empty search. Tokens separated by
+# spaces must all match: 'r3' row 3, 'c5' column 5, a number for edits
+# involving that digit, '填数' or '笔记' for value or note edits, anything
+# else for edits whose kind words (KIND_WORDS) contain it.
+def parse_query(query: str) -> Optional[EditPredicate]:
+    tests = [_token_predicate(token) for token in query.split()]
+    if len(tests) == 0:
+        return None
+    return lambda edit: all(test(edit) for test in tests)
+
+
+# A scrolling list of the edits of a GameHistory that only ever holds the
+# rows on screen: scrolling, new edits and searches rewrite those few rows
+# from the history, so the cost of an update does not grow with the game.
+# A search keeps the positions of the matching edits, tested once each as
+# edits come in; rows past the history cursor (undone edits) are greyed.
+# Double-clicking a row calls 'on_jump' with the number of edits up to and
+# including it.
+class HistoryView:
+    history: GameHistory
+    rows: int
+    # index of the first row on screen, among the shown edits
+    top: int
+    # keep the last edit in view as edits come in
+    follow: bool
+    on_jump: Callable[[int], None]
+    color_done: str
+    color_undone: str
+    query: tk.StringVar
+    entry_query: tk.Entry
+    listbox: tk.Listbox
+    scrollbar: tk.Scrollbar
+    render_job: Optional[str]
+    __predicate: Optional[EditPredicate]
+    __tokens: list[str]
+    # positions of the matching edits among the first '__checked' edits
+    __matches: list[int]
+    __checked: int
+
+    def __init__(self, root, history: GameHistory, /, rows: int, font, on_jump: Callable[[int], None],
+                 color_done: str = "#000000", color_undone: str = "#A0A0A0"):
+        self.history = history
+        self.rows = rows
+        self.top = 0
+        self.follow = True
+        self.on_jump = on_jump
+        self.color_done = color_done
+        self.color_undone = color_undone
+        self.render_job = None
+        self.__predicate = None
+        self.__tokens = []
+        self.__matches = []
+        self.__checked = 0
+        self.query = tk.StringVar(root)
+        self.query.trace_add("write", lambda *_: self.__set_query(self.query.get()))
+        self.entry_query = tk.Entry(root, textvariable=self.query, font=font)
+        self.listbox = tk.Listbox(root, font=font, height=rows, selectmode=tk.NONE, activestyle="none")
+        self.scrollbar = tk.Scrollbar(root, orient=tk.VERTICAL, command=lambda *args: self.__yview(*args))
+        self.listbox.bind("<Button-1>", lambda _: "break")
+        self.listbox.bind("<Double-Button-1>", lambda event: self.__jump_to_row(self.listbox.nearest(event.y)))
+        self.listbox.bind("<MouseWheel>", lambda event: self.__scroll(-3 if event.delta > 0 else 3))
+        self.listbox.bind("<Button-4>", lambda _: self.__scroll(-3))
+        self.listbox.bind("<Button-5>", lambda _: self.__scroll(3))
+
+    # the search box on top, the rows below it with the scrollbar on their right
+    def place(self, x: int, y: int, width: int, query_height: int, scrollbar_width: int = 16):
+        self.entry_query.place(x=x, y=y, width=width, height=query_height)
+        self.listbox.place(x=x, y=y + query_height, width=width - scrollbar_width)
+        self.scrollbar.place(x=x + width - scrollbar_width, y=y + query_height, width=scrollbar_width,
+                             height=self.listbox.winfo_reqheight())
+
+    # number of edits shown, all of them or the search matches
+    def count(self) -> int:
+        if self.__predicate is None:
+            return len(self.history)
+        return len(self.__matches)
+
+    def __position(self, index: int) -> int:
+        return index if self.__predicate is None else self.__matches[index]
+
+    # the edits from 'position' on were replaced or added
+    def edits_changed(self, position: int):
+        if self.__predicate is not None:
+            self.__checked = min(self.__checked, position)
+            del self.__matches[bisect_left(self.__matches, self.__checked):]
+            self.__check_new_edits()
+        self.__update()
+
+    # only the cursor moved, the edits are the same
+    def cursor_moved(self):
+        if self.follow:
+            # follow the cursor rather than the end, so an undo stays in view
+            self.__show(self.__index_of_cursor())
+        self.__schedule_render()
+
+    # a new game or a resumed one: start over at the end
+    def reset(self):
+        self.__checked = 0
+        self.__matches.clear()
+        self.follow = True
+        self.edits_changed(0)
+
+    def __check_new_edits(self):
+        assert self.__predicate is not None
+        entries = self.history.entries
+        for position in range(self.__checked, len(entries)):
+            if self.__predicate(entries[position]):
+                self.__matches.append(position)
+        self.__checked = len(entries)
+
+    def __set_query(self, query: str):
+        tokens = query.split()
+        narrowed = (self.__predicate is not None and len(tokens) > len(self.__tokens)
+                    and tokens[:len(self.__tokens)] == self.__tokens)
+        self.__predicate = parse_query(query)
+        self.__tokens = tokens
+        if narrowed:
+            # another token only drops matches, so test the matches alone
+            predicate = self.__predicate
+            assert predicate is not None
+            entries = self.history.entries
+            self.__matches = [position for position in self.__matches if predicate(entries[position])]
+        else:
+            self.__matches = []
+            self.__checked = 0
+        if self.__predicate is not None:
+            self.__check_new_edits()
+        self.follow = True
+        self.__update()
+
+    # index of the last shown edit at or before the cursor
+    def __index_of_cursor(self) -> int:
+        if self.__predicate is None:
+            return self.history.cursor - 1
+        return bisect_left(self.__matches, self.history.cursor) - 1
+
+    def __show(self, index: int):
+        if index < self.top:
+            self.top = max(index, 0)
+        elif index >= self.top + self.rows:
+            self.top = index - self.rows + 1
+
+    def __update(self):
+        if self.follow:
+            self.top = max(self.count() - self.rows, 0)
+        self.top = min(self.top, max(self.count() - self.rows, 0))
+        self.__schedule_render()
+
+    def __scroll(self, delta: int):
+        self.__scroll_to(self.top + delta)
+        return "break"
+
+    def __scroll_to(self, top: int):
+        last_top = max(self.count() - self.rows, 0)
+        self.top = min(max(top, 0), last_top)
+        self.follow = self.top == last_top
+        self.__schedule_render()
+
+    # the scrollbar's yview protocol: ("moveto", fraction) or ("scroll", n, "units" | "pages")
+    def __yview(self, *args):
+        if args[0] == "moveto":
+            self.__scroll_to(round(float(args[1]) * self.count()))
+        elif args[0] == "scroll":
+            step = self.rows if args[2] == "pages" else 1
+            self.__scroll_to(self.top + int(args[1]) * step)
+
+    def __jump_to_row(self, row: int):
+        index = self.top + row
+        if 0 <= index < self.count():
+            self.on_jump(self.__position(index) + 1)
+        return "break"
+
+    # updates arriving in a burst (auto-solve, a long jump) are drawn once
+    def __schedule_render(self):
+        if self.render_job is None:
+            self.render_job = self.listbox.after_idle(lambda: self.__render())
+
+    def __render(self):
+        self.render_job = None
+        count = self.count()
+        end = min(self.top + self.rows, count)
+        entries = self.history.entries
+        self.listbox.delete(0, tk.END)
+        for index in range(self.top, end):
+            position = self.__position(index)
+            self.listbox.insert(tk.END, f"{position + 1:<4} {entries[position].describe()}")
+            color = self.color_undone if position >= self.history.cursor else self.color_done
+            self.listbox.itemconfig(index - self.top, fg=color)
+        if count == 0:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.top / count, end / count)
@@ -0,0 +1,302 @@
+import os
+import struct
+from collections.abc import Iterator
+from typing import BinaryIO, NamedTuple, Optional
+from sudoku import SudokuState, SNAPSHOT_FIXED_SIZE
+
+# A game is a start board plus a timeline of edits with a cursor: undo
+# moves the cursor back, redo forward, and a new edit drops whatever lies
+# past the cursor. Every SNAPSHOT_INTERVAL edits the board is snapshotted
+# (SudokuState.snapshot, 256 bytes), so any point of the timeline is
+# reached by restoring the snapshot at or before it and replaying fewer
+# than SNAPSHOT_INTERVAL edits.
+#
+# Journal file layout: a header (magic, version) followed by records of a
+# one-byte tag and a fixed-size body:
+#   G  snapshot                      a new game starts from this board
+#   E  position, kind, row, col, old, new
+#                                    edit number 'position' (0-based); the
+#                                    timeline is cut there before appending
+#   S  position, snapshot            the board after 'position' edits
+#   C  position                      the cursor moved to 'position'
+# Starting a game truncates the file, so it only ever holds the current
+# game. A torn record at the end (a crash mid-write) is dropped on resume.
+MAGIC = b"SDKJ"
+VERSION = 1
+HEADER = struct.Struct("<4sB")
+SNAPSHOT_SIZE = 2 + 81 + SNAPSHOT_FIXED_SIZE + 2 * 81
+TAG_GAME = b"G"
+TAG_EDIT = b"E"
+TAG_SNAPSHOT = b"S"
+TAG_CURSOR = b"C"
+EDIT = struct.Struct("<IBBBBB")
+POSITION = struct.Struct("<I")
+RECORD_BODY_SIZE = {
+    TAG_GAME: SNAPSHOT_SIZE,
+    TAG_EDIT: EDIT.size,
+    TAG_SNAPSHOT: POSITION.size + SNAPSHOT_SIZE,
+    TAG_CURSOR: POSITION.size,
+}
+SNAPSHOT_INTERVAL = 32
+
+# edit kinds, as stored in journals (2 and 4 are unused)
+SET_VALUE = 0    # old and new numbers, 0 for an empty cell
+ADD_NOTE = 1     # new is the digit
+CLEAR_NOTES = 3
+FILL_ALL_NOTES = 5  # every cell that is not a given; row and col are 0
+
+
+class Edit(NamedTuple):
+    kind: int
+    row: int
+    col: int
+    old: int = 0
+    new: int = 0
+
+    def apply(self, state: SudokuState):
+        (row, col) = (self.row, self.col)
+        if self.kind == SET_VALUE:
+            if self.new == 0:
+                state.clr_cell(row, col)
+            else:
+                state.set_cell(row, col, self.new)
+        elif self.kind == ADD_NOTE:
+            state.add_note(row, col, self.new)
+        elif self.kind == CLEAR_NOTES:
+            state.clr_note(row, col)
+        elif self.kind == FILL_ALL_NOTES:
+            for r in range(9):
+                for c in range(9):
+                    if not state.get_cell(r, c).isfixed():
+                        state.fill_notes(r, c)
+        else:
+            raise ValueError(f"unknown edit kind {self.kind}")
+
+    # the edit undoing this one without replaying the timeline, None if the
+    # old state is not part of the edit
+    def inverse(self) -> Optional["Edit"]:
+        if self.kind == SET_VALUE:
+            return self._replace(old=self.new, new=self.old)
+        return None
+
+    def describe(self) -> str:
+        cell = f"({self.row}, {self.col})"
+        if self.kind == SET_VALUE:
+            return f"{cell} {self.old or None} -> {self.new or None}"
+        if self.kind == ADD_NOTE:
+            return f"{cell} 笔记 +{self.new}"
+        if self.kind == CLEAR_NOTES:
+            return f"{cell} 清除笔记"
+        return "一键笔记"
+
+
+# Appends journal records through a buffered file and fsyncs them in
+# batches: after 'sync_every' records, or whenever sync() is called. A
+# crash loses at most the records since the last sync.
+class Journal:
+    path: str
+    sync_every: int
+    pending: int
+    __file: BinaryIO
+
+    def __init__(self, path: str, sync_every: int = 64):
+        self.path = path
+        self.sync_every = sync_every
+        self.pending = 0
+        self.__file = open(path, "ab")
+        if self.__file.tell() == 0:
+            self.__file.write(HEADER.pack(MAGIC, VERSION))
+
+    def start(self, snapshot: bytes):
+        self.truncate(0)
+        self.__file.write(HEADER.pack(MAGIC, VERSION))
+        self.__append(TAG_GAME + snapshot)
+        self.sync()
+
+    def edit(self, position: int, edit: Edit):
+        self.__append(TAG_EDIT + EDIT.pack(position, *edit))
+
+    def snapshot(self, position: int, snapshot: bytes):
+        self.__append(TAG_SNAPSHOT + POSITION.pack(position) + snapshot)
+
+    def cursor(self, position: int):
+        self.__append(TAG_CURSOR + POSITION.pack(position))
+
+    def __append(self, record: bytes):
+        self.__file.write(record)
+        self.pending += 1
+        if self.pending >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        if self.pending == 0:
+            return
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.pending = 0
+
+    # drop everything past byte 'size', used to cut off a torn record
+    def truncate(self, size: int):
+        self.__file.flush()
+        self.__file.truncate(size)
+
+    def close(self):
+        if not self.__file.closed:
+            self.sync()
+            self.__file.close()
+
+
+# the (tag, body) records of a journal file up to the last complete one,
+# along with the offset just past that record
+def read_journal(path: str) -> tuple[list[tuple[bytes, bytes]], int]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size or HEADER.unpack_from(data) != (MAGIC, VERSION):
+        return [], 0
+    records = []
+    offset = HEADER.size
+    for tag, body, end in _iter_records(data, offset):
+        records.append((tag, body))
+        offset = end
+    return records, offset
+
+
+def _iter_records(data: bytes, offset: int) -> Iterator[tuple[bytes, bytes, int]]:
+    while offset < len(data):
+        tag = data[offset:offset + 1]
+        size = RECORD_BODY_SIZE.get(tag)
+        end = offset + 1 + size if size is not None else len(data) + 1
+        if end > len(data):
+            return
+        yield tag, data[offset + 1:end], end
+        offset = end
+
+
+# The timeline of one 9x9 game, mirrored to a journal if one is given.
+# 'entries' past 'cursor' are undone edits that redo can bring back.
+class GameHistory:
+    journal: Optional[Journal]
+    entries: list[Edit]
+    cursor: int
+    # snapshots[k] is the board after k * SNAPSHOT_INTERVAL edits
+    snapshots: list[bytes]
+
+    def __init__(self, journal: Optional[Journal] = None):
+        self.journal = journal
+        self.entries = []
+        self.cursor = 0
+        self.snapshots = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # False until start() or a successful resume()
+    def has_game(self) -> bool:
+        return len(self.snapshots) != 0
+
+    def start(self, state: SudokuState):
+        self.entries.clear()
+        self.cursor = 0
+        self.snapshots = [state.snapshot()]
+        if self.journal is not None:
+            self.journal.start(self.snapshots[0])
+
+    # apply 'edit' to 'state' at the cursor, dropping the undone edits
+    def record(self, state: SudokuState, edit: Edit):
+        edit.apply(state)
+        position = self.cursor
+        del self.entries[position:]
+        del self.snapshots[position // SNAPSHOT_INTERVAL + 1:]
+        self.entries.append(edit)
+        self.cursor = position + 1
+        if self.journal is not None:
+            self.journal.edit(position, edit)
+        if self.cursor % SNAPSHOT_INTERVAL == 0:
+            self.snapshots.append(state.snapshot())
+            if self.journal is not None:
+                self.journal.snapshot(self.cursor, self.snapshots[-1])
+
+    def can_undo(self) -> bool:
+        return self.cursor > 0
+
+    def can_redo(self) -> bool:
+        return self.cursor < len(self.entries)
+
+    def undo(self, state: SudokuState):
+        assert self.can_undo()
+        inverse = self.entries[self.cursor - 1].inverse()
+        if inverse is None:
+            self.seek(state, self.cursor - 1)
+            return
+        inverse.apply(state)
+        self.__move_cursor(self.cursor - 1)
+
+    def redo(self, state: SudokuState):
+        assert self.can_redo()
+        self.entries[self.cursor].apply(state)
+        self.__move_cursor(self.cursor + 1)
+
+    # put 'state' in the position after the first 'position' edits: one
+    # restore plus fewer than SNAPSHOT_INTERVAL edits, wherever the cursor was
+    def seek(self, state: SudokuState, position: int):
+        assert 0 <= position <= len(self.entries)
+        self.__goto(state, position)
+        self.__move_cursor(position)
+
+    def __goto(self, state: SudokuState, position: int):
+        base = position // SNAPSHOT_INTERVAL
+        state.restore(self.snapshots[base])
+        for edit in self.entries[base * SNAPSHOT_INTERVAL:position]:
+            edit.apply(state)
+
+    def __move_cursor(self, position: int):
+        self.cursor = position
+        if self.journal is not None:
+            self.journal.cursor(position)
+
+    def sync(self):
+        if self.journal is not None:
+            self.journal.sync()
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+    # load the game in the journal into 'state', False if it holds none.
+    # Only the edits after the last snapshot before the cursor are replayed.
+    def resume(self, state: SudokuState) -> bool:
+        assert self.journal is not None
+        records, end = read_journal(self.journal.path)
+        self.journal.truncate(end)
+        entries: list[Edit] = []
+        snapshots: list[bytes] = []
+        cursor = 0
+        for tag, body in records:
+            if tag == TAG_GAME:
+                entries, snapshots, cursor = [], [body], 0
+            elif tag == TAG_EDIT:
+                (position, *fields) = EDIT.unpack(body)
+                del entries[position:]
+                del snapshots[position // SNAPSHOT_INTERVAL + 1:]
+                entries.append(Edit(*fields))
+                cursor = position + 1
+            elif tag == TAG_SNAPSHOT:
+                (position,) = POSITION.unpack_from(body)
+                if position == len(snapshots) * SNAPSHOT_INTERVAL:
+                    snapshots.append(body[POSITION.size:])
+            else:
+                (cursor,) = POSITION.unpack(body)
+        if len(snapshots) == 0:
+            return False
+        self.entries, self.snapshots = entries, snapshots
+        # snapshots lost with a torn tail are taken again from the last one kept
+        missing_from = (len(snapshots) - 1) * SNAPSHOT_INTERVAL
+        if missing_from + SNAPSHOT_INTERVAL <= len(entries):
+            self.__goto(state, missing_from)
+            for position in range(missing_from, len(entries)):
+                entries[position].apply(state)
+                if (position + 1) % SNAPSHOT_INTERVAL == 0:
+                    snapshots.append(state.snapshot())
+        self.__goto(state, cursor)
+        self.cursor = cursor
+        return True
@@ -0,0 +1,310 @@
+from dataclasses import dataclass, field
+from typing import Optional
+from collections.abc import Callable, Sequence
+from solve_stats import SolveStats
+from geometry import Geometry, STANDARD
+
+
+def unit_name(u: int, size: int = 9) -> str:
+    kind = ("行", "列", "宫")[u // size]
+    return f"{kind}{u % size}"
+
+
+def cell_name(i: int, size: int = 9) -> str:
+    return f"({i // size}, {i % size})"
+
+
+def digits_of(mask: int) -> list[int]:
+    digits = []
+    while mask:
+        bit = mask & -mask
+        digits.append(bit.bit_length() - 1)
+        mask ^= bit
+    return digits
+
+
+# one logical deduction: either a placement of 'digit' in 'cell', or a set of
+# candidate eliminations justified by 'cells'/'digits' within 'unit'
+@dataclass
+class Step:
+    technique: str
+    unit: int
+    cells: tuple[int, ...]
+    digits: tuple[int, ...]
+    placement: Optional[tuple[int, int]] = None
+    eliminations: list[tuple[int, int]] = field(default_factory=list)
+
+    # 'size' is the number of rows of the board the step was found on
+    def describe(self, size: int = 9) -> str:
+        where = unit_name(self.unit, size)
+        cells = "、".join(cell_name(i, size) for i in self.cells)
+        digits = "、".join(map(str, self.digits))
+        if self.technique == "naked_single":
+            reason = f"{cells} 只剩候选数 {digits}"
+        elif self.technique == "hidden_single":
+            reason = f"{where} 中只有 {cells} 可以填 {digits}"
+        elif self.technique == "pointing":
+            reason = f"{where} 中的 {digits} 只能在 {cells}，它们在同一行或列"
+        elif self.technique == "claiming":
+            reason = f"{where} 中的 {digits} 只能在 {cells}，它们在同一宫"
+        elif self.technique == "naked_pair":
+            reason = f"{where} 中 {cells} 的候选数都是 {digits}"
+        else:
+            reason = f"{where} 中的 {digits} 只能在 {cells}"
+        if self.placement is not None:
+            (i, n) = self.placement
+            return f"{TECHNIQUE_NAMES[self.technique]}：{reason}，{cell_name(i, size)} 填 {n}"
+        removed = "、".join(f"{cell_name(i, size)} 的 {n}" for (i, n) in self.eliminations)
+        return f"{TECHNIQUE_NAMES[self.technique]}：{reason}，删去 {removed}"
+
+
+TECHNIQUE_NAMES = {
+    "naked_single": "唯一候选数",
+    "hidden_single": "隐性唯一",
+    "pointing": "区块摒除",
+    "claiming": "行列区块摒除",
+    "naked_pair": "显性数对",
+    "hidden_pair": "隐性数对",
+}
+
+
+# numbers and candidate masks of a board under deduction. 'broken' is set
+# as soon as some cell or unit is left with no way to be completed.
+class LogicBoard:
+    geometry: Geometry
+    numbers: list[int]
+    candidates: list[int]
+    # cells in the order they were filled by assign()
+    placed: list[tuple[int, int]]
+    broken: bool
+
+    def __init__(self, numbers: Sequence[int], geometry: Geometry = STANDARD):
+        self.geometry = geometry
+        self.numbers = list(numbers)
+        self.candidates = [0] * geometry.ncells
+        self.placed = []
+        self.broken = False
+        peers = geometry.peers
+        for i in range(geometry.ncells):
+            if self.numbers[i] != 0:
+                continue
+            used = 0
+            for j in peers[i]:
+                used |= 1 << self.numbers[j]
+            self.candidates[i] = ~used & geometry.all_digits
+            if self.candidates[i] == 0:
+                self.broken = True
+        if any(self.numbers[i] != 0 and any(self.numbers[j] == self.numbers[i] for j in peers[i])
+               for i in range(geometry.ncells)):
+            # two givens conflict
+            self.broken = True
+
+    # a board whose candidate masks are already known, skipping the peer scan
+    @staticmethod
+    def from_candidates(numbers: Sequence[int], candidates: Sequence[int],
+                        geometry: Geometry = STANDARD) -> "LogicBoard":
+        board = LogicBoard.__new__(LogicBoard)
+        board.geometry = geometry
+        board.numbers = list(numbers)
+        board.candidates = list(candidates)
+        board.placed = []
+        board.broken = any(board.numbers[i] == 0 and board.candidates[i] == 0 for i in range(geometry.ncells))
+        return board
+
+    def copy(self) -> "LogicBoard":
+        board = LogicBoard.__new__(LogicBoard)
+        board.geometry = self.geometry
+        board.numbers = self.numbers[:]
+        board.candidates = self.candidates[:]
+        board.placed = self.placed[:]
+        board.broken = self.broken
+        return board
+
+    def is_complete(self) -> bool:
+        return 0 not in self.numbers
+
+    def assign(self, i: int, n: int):
+        self.numbers[i] = n
+        self.candidates[i] = 0
+        self.placed.append((i, n))
+        bit = 1 << n
+        for j in self.geometry.peers[i]:
+            if self.candidates[j] & bit:
+                self.eliminate(j, n)
+            elif self.numbers[j] == n:
+                self.broken = True
+
+    def eliminate(self, i: int, n: int):
+        self.candidates[i] &= ~(1 << n)
+        if self.candidates[i] == 0 and self.numbers[i] == 0:
+            self.broken = True
+
+    def apply(self, step: Step):
+        if step.placement is not None:
+            self.assign(*step.placement)
+        for (i, n) in step.eliminations:
+            self.eliminate(i, n)
+
+    # cells of unit 'u' that may still take digit 'n'
+    def places(self, u: int, n: int) -> list[int]:
+        bit = 1 << n
+        return [i for i in self.geometry.units[u] if self.candidates[i] & bit]
+
+
+def find_naked_single(board: LogicBoard) -> Optional[Step]:
+    for i in range(board.geometry.ncells):
+        mask = board.candidates[i]
+        if mask != 0 and mask & (mask - 1) == 0:
+            n = mask.bit_length() - 1
+            return Step("naked_single", board.geometry.row_of[i], (i,), (n,), placement=(i, n))
+    return None
+
+
+def find_hidden_single(board: LogicBoard) -> Optional[Step]:
+    for u, cells in enumerate(board.geometry.units):
+        present = 0
+        for i in cells:
+            present |= 1 << board.numbers[i]
+        for n in board.geometry.digits():
+            if present >> n & 1:
+                continue
+            places = board.places(u, n)
+            if len(places) == 1:
+                return Step("hidden_single", u, (places[0],), (n,), placement=(places[0], n))
+            if len(places) == 0:
+                board.broken = True
+                return None
+    return None
+
+
+# a digit confined to one line inside a box (pointing), or to one box inside
+# a line (claiming), can be removed from the rest of that line or box
+def find_locked_candidates(board: LogicBoard) -> Optional[Step]:
+    g = board.geometry
+    cell_units = g.cell_units
+    for u in range(3 * g.size):
+        for n in g.digits():
+            places = board.places(u, n)
+            if len(places) < 2:
+                continue
+            if u >= 2 * g.size:
+                technique = "pointing"
+                shared = [v for v in (cell_units[places[0]][0], cell_units[places[0]][1])
+                          if all(v in cell_units[i] for i in places)]
+            else:
+                technique = "claiming"
+                box = cell_units[places[0]][2]
+                shared = [box] if all(cell_units[i][2] == box for i in places) else []
+            for v in shared:
+                eliminations = [(i, n) for i in board.places(v, n) if i not in places]
+                if len(eliminations) != 0:
+                    return Step(technique, u, tuple(places), (n,), eliminations=eliminations)
+    return None
+
+
+def find_naked_pair(board: LogicBoard) -> Optional[Step]:
+    for u, cells in enumerate(board.geometry.units):
+        pairs = [i for i in cells if board.candidates[i].bit_count() == 2]
+        for a in range(len(pairs)):
+            for b in range(a + 1, len(pairs)):
+                mask = board.candidates[pairs[a]]
+                if board.candidates[pairs[b]] != mask:
+                    continue
+                eliminations = [(i, n) for i in cells if i not in (pairs[a], pairs[b])
+                                for n in digits_of(board.candidates[i] & mask)]
+                if len(eliminations) != 0:
+                    return Step("naked_pair", u, (pairs[a], pairs[b]), tuple(digits_of(mask)),
+                                eliminations=eliminations)
+    return None
+
+
+def find_hidden_pair(board: LogicBoard) -> Optional[Step]:
+    for u in range(3 * board.geometry.size):
+        twice = [(n, board.places(u, n)) for n in board.geometry.digits()]
+        twice = [(n, places) for (n, places) in twice if len(places) == 2]
+        for a in range(len(twice)):
+            for b in range(a + 1, len(twice)):
+                (n1, places), (n2, other) = twice[a], twice[b]
+                if places != other:
+                    continue
+                keep = 1 << n1 | 1 << n2
+                eliminations = [(i, n) for i in places for n in digits_of(board.candidates[i] & ~keep)]
+                if len(eliminations) != 0:
+                    return Step("hidden_pair", u, tuple(places), (n1, n2), eliminations=eliminations)
+    return None
+
+
+# techniques from cheapest to most expensive to look for
+TECHNIQUES: list[Callable[[LogicBoard], Optional[Step]]] = [
+    find_naked_single,
+    find_hidden_single,
+    find_locked_candidates,
+    find_naked_pair,
+    find_hidden_pair,
+]
+
+
+# the cheapest deduction available on the board, None if stuck or broken
+def next_step(board: LogicBoard) -> Optional[Step]:
+    for technique in TECHNIQUES:
+        if board.broken:
+            return None
+        step = technique(board)
+        if step is not None:
+            return step
+    return None
+
+
+# apply deductions until none is left. Returns False if the board turns out
+# to be unsolvable. Every applied step is appended to 'steps' if given.
+def propagate(board: LogicBoard, stats: SolveStats, steps: Optional[list[Step]] = None) -> bool:
+    while not board.broken:
+        step = next_step(board)
+        if step is None:
+            break
+        stats.deductions += 1
+        board.apply(step)
+        if steps is not None:
+            steps.append(step)
+    return not board.broken
+
+
+def _search(board: LogicBoard, stats: SolveStats, depth: int,
+            should_stop: Optional[Callable[[], bool]]) -> Optional[LogicBoard]:
+    if not propagate(board, stats):
+        return None
+    if board.is_complete():
+        return board
+
+    # branch on the empty cell with the fewest candidates
+    stats.candidate_computations += 1
+    i = min((i for i in range(board.geometry.ncells) if board.numbers[i] == 0),
+            key=lambda i: board.candidates[i].bit_count())
+    for n in digits_of(board.candidates[i]):
+        stats.node(depth + 1)
+        # a node here costs a whole propagation, so poll on every one
+        if should_stop is not None and should_stop():
+            stats.cancelled = True
+        if stats.cancelled:
+            return None
+        child = board.copy()
+        child.assign(i, n)
+        solved = _search(child, stats, depth + 1, should_stop)
+        if solved is not None:
+            return solved
+        if stats.cancelled:
+            return None
+        stats.backtrack()
+    return None
+
+
+# solve by deduction, guessing only when no technique applies. Returns the
+# (cell, digit) placements in the order they were made, None if unsolvable
+# or if 'should_stop' asked to stop (stats.cancelled is then set).
+def solve(numbers: Sequence[int], stats: Optional[SolveStats] = None,
+          should_stop: Optional[Callable[[], bool]] = None,
+          geometry: Geometry = STANDARD) -> Optional[list[tuple[int, int]]]:
+    stats = stats if stats is not None else SolveStats()
+    board = LogicBoard(numbers, geometry)
+    solved = _search(board, stats, 0, should_stop)
+    return solved.placed if solved is not None else None
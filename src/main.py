@@ -1,6 +1,13 @@
+import os
 import tkinter as tk
 from enum import Enum
-from sudoku import Difficulty, SudokuState
+from sudoku import SudokuState
+from bank import PuzzleBank, BankRefiller
+from solve_cache import SolveCache
+from symmetry import PuzzleMultiplier
+from prefetch import PuzzlePrefetcher
+from journal import Journal, GameHistory
+from grader import Grader
 import sudoku_render as sr
 import controller as ctl
 
@@ -26,7 +33,25 @@ canvas = tk.Canvas(root, background=color.ORANGE.value,
                    highlightthickness=0)
 canvas.place(x=0, y=0, width=width, height=height, anchor=tk.NW)
 
-sudoku = SudokuState(difficulty=Difficulty.EASY)
+data_dir = os.path.dirname(os.path.abspath(__file__))
+bank_path = os.path.join(data_dir, "puzzles.bank")
+# difficulties follow the techniques a puzzle needs, not just its blank count
+grader = Grader()
+bank_refiller = BankRefiller(PuzzleBank.open_or_create(bank_path, capacity=200), low_water=50, grader=grader)
+bank_refiller.start()
+solve_cache = SolveCache(max_entries=1000, path=os.path.join(data_dir, "solutions.cache"))
+
+# every banked puzzle serves a few games, each one a random symmetric variant
+puzzle_source = PuzzleMultiplier(seed_source=bank_refiller, uses_per_seed=20, grader=grader)
+# puzzles are made ahead of time off the Tk thread; the window opens on an
+# empty board and the controller loads the first puzzle once it is ready
+prefetcher = PuzzlePrefetcher(source=puzzle_source, depth=2)
+prefetcher.start()
+sudoku = SudokuState.from_line("0" * 81)
+# the game in progress is journaled; if the last session left one behind,
+# it is picked up where it stopped instead of starting a new one
+history = GameHistory(Journal(os.path.join(data_dir, "game.journal")))
+history.resume(sudoku)
 sudoku_render = sr.SudokuRender(canvas, sudoku,
                                 coord=(cell_size, cell_size),
                                 cell_size=cell_size,
@@ -39,7 +64,12 @@ sudoku_render = sr.SudokuRender(canvas, sudoku,
                                 num_color_fixed=color.BLACK.value,
                                 num_color_valid=color.GREY.value,
                                 num_color_invalid=color.RED.value)
-ctrl = ctl.Controller(root, sudoku, sudoku_render, cell_size=cell_size, bg=color.ORANGE.value, coord=(cell_size, cell_size))
+ctrl = ctl.Controller(root, sudoku, sudoku_render, cell_size=cell_size, bg=color.ORANGE.value, coord=(cell_size, cell_size),
+                      solve_cache=solve_cache, prefetcher=prefetcher,
+                      history=history)
 
 sudoku_render.draw_sudoku()
 root.mainloop()
+prefetcher.stop()
+history.close()
+solve_cache.close()
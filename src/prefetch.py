@@ -0,0 +1,68 @@
+import threading
+from collections import deque
+from typing import Optional
+from sudoku import SudokuState, Difficulty, PuzzleSource
+
+# Background thread keeping up to 'depth' ready puzzle lines per difficulty,
+# so a restart takes a puzzle without waiting for generation. Lines come
+# from 'source' (or are generated when it has none to give); the difficulty
+# drawn last is topped up first, so repeated restarts at one difficulty
+# keep finding a puzzle even when its generation is slow.
+class PuzzlePrefetcher(threading.Thread):
+    source: Optional[PuzzleSource]
+    depth: int
+    lock: threading.Lock
+    __ready: dict[Difficulty, deque[str]]
+    __priority: Difficulty
+    __wakeup: threading.Event
+    __stopped: bool
+
+    def __init__(self, source: Optional[PuzzleSource] = None, depth: int = 2,
+                 priority: Difficulty = Difficulty.EASY):
+        super().__init__(name="puzzle-prefetcher", daemon=True)
+        self.source = source
+        self.depth = depth
+        self.lock = threading.Lock()
+        self.__ready = {d: deque() for d in Difficulty}
+        self.__priority = priority
+        self.__wakeup = threading.Event()
+        self.__stopped = False
+
+    # a PuzzleSource that never blocks: a ready puzzle, or None while the
+    # worker is still producing one
+    def draw(self, difficulty: Difficulty) -> Optional[str]:
+        with self.lock:
+            ready = self.__ready[difficulty]
+            line = ready.popleft() if len(ready) != 0 else None
+            self.__priority = difficulty
+        self.__wakeup.set()
+        return line
+
+    def size(self, difficulty: Difficulty) -> int:
+        with self.lock:
+            return len(self.__ready[difficulty])
+
+    def stop(self):
+        self.__stopped = True
+        self.__wakeup.set()
+
+    # the difficulty to top up next, None when every queue is full
+    def __wanted(self) -> Optional[Difficulty]:
+        with self.lock:
+            order = [self.__priority] + [d for d in Difficulty if d is not self.__priority]
+            return next((d for d in order if len(self.__ready[d]) < self.depth), None)
+
+    def __produce(self, difficulty: Difficulty) -> str:
+        line = self.source.draw(difficulty) if self.source is not None else None
+        return line if line is not None else SudokuState(difficulty).to_line()
+
+    def run(self):
+        while not self.__stopped:
+            difficulty = self.__wanted()
+            if difficulty is None:
+                self.__wakeup.wait()
+                self.__wakeup.clear()
+                continue
+            line = self.__produce(difficulty)
+            with self.lock:
+                self.__ready[difficulty].append(line)
@@ -0,0 +1,240 @@
+import struct
+import sys
+from array import array
+from collections.abc import Iterable, Iterator
+from typing import BinaryIO, NamedTuple, Optional, TextIO
+from sudoku import SudokuState, Difficulty, SNAPSHOT_FIXED_SIZE
+
+# Two interchange formats for 9x9 boards:
+#
+# line:   one puzzle per line, 81 characters '0'..'9' in row-major order
+#         with '0' or '.' for an empty cell. Blank lines and lines starting
+#         with '#' are skipped when reading; any other line that is not a
+#         puzzle raises ValueError.
+#
+# packed: a header (magic, version, flags) followed by fixed-size records.
+#         A record holds the 81 numbers as 4-bit nibbles (41 bytes), the
+#         givens as an 81-bit little-endian bitmap (11 bytes) and, if the
+#         FLAG_NOTES bit is set, 81 little-endian uint16 note bitmasks.
+#
+# Readers are generators that hold one buffer of records at a time, so
+# files of any size are read in constant memory.
+MAGIC = b"SDKP"
+VERSION = 1
+HEADER = struct.Struct("<4sBB")
+FLAG_NOTES = 1
+NUMBERS_SIZE = 41
+GIVENS_SIZE = SNAPSHOT_FIXED_SIZE
+NOTES_SIZE = 2 * 81
+# records read per buffer
+READ_BATCH = 4096
+
+
+class PuzzleRecord(NamedTuple):
+    # 81 characters '0'..'9', '0' for an empty cell
+    line: str
+    # bit i is set if cell i is a given
+    givens: int
+    # note bitmask of every cell, None if not stored
+    notes: Optional[array] = None
+
+    # the puzzle itself: the givens only, without the player's numbers
+    def puzzle(self) -> str:
+        return "".join(ch if self.givens >> i & 1 else "0" for i, ch in enumerate(self.line))
+
+
+# raises ValueError unless 'line' is 81 characters '0'..'9' or '.'; other
+# letters would otherwise pack silently as hex digits
+def _check_line(line: str):
+    if len(line) != 81:
+        raise ValueError(f"expected 81 characters per puzzle, got {len(line)}: {line!r}")
+    if any(ch not in "0123456789." for ch in line):
+        raise ValueError(f"expected digits or '.' only: {line!r}")
+
+
+def pack_numbers(line: str) -> bytes:
+    _check_line(line)
+    return bytes.fromhex(line.replace(".", "0") + "0")
+
+
+def unpack_numbers(data: bytes) -> str:
+    return data.hex()[:81]
+
+
+def givens_of_line(line: str) -> int:
+    givens = 0
+    for i, ch in enumerate(line):
+        if ch not in "0.":
+            givens |= 1 << i
+    return givens
+
+
+def record_from_line(line: str) -> PuzzleRecord:
+    _check_line(line)
+    line = line.replace(".", "0")
+    return PuzzleRecord(line, givens_of_line(line))
+
+
+def record_from_state(state: SudokuState, with_notes: bool = False) -> PuzzleRecord:
+    return PuzzleRecord(state.to_line(), state.fixed, state.notes[:] if with_notes else None)
+
+
+# rebuild a game from a record, including the player's numbers and notes
+def state_from_record(record: PuzzleRecord, difficulty: Difficulty = Difficulty.EASY) -> SudokuState:
+    notes = record.notes if record.notes is not None else array("H", bytes(NOTES_SIZE))
+    total_blank = 81 - record.givens.bit_count()
+    snapshot = (bytes((difficulty.value, total_blank))
+        + bytes(int(ch) for ch in record.line)
+        + record.givens.to_bytes(GIVENS_SIZE, "little")
+        + notes.tobytes())
+    state = SudokuState.__new__(SudokuState)
+    state.source = None
+    state.restore(snapshot)
+    return state
+
+
+# the stripped lines of a line file without the blank and comment lines,
+# unchecked
+def iter_raw_lines(f: TextIO) -> Iterator[str]:
+    for line in f:
+        line = line.strip()
+        if len(line) == 0 or line.startswith("#"):
+            continue
+        yield line
+
+
+def iter_lines(f: TextIO) -> Iterator[PuzzleRecord]:
+    for line in iter_raw_lines(f):
+        yield record_from_line(line)
+
+
+def write_lines(f: TextIO, records: Iterable[PuzzleRecord]) -> int:
+    count = 0
+    for record in records:
+        f.write(record.line)
+        f.write("\n")
+        count += 1
+    return count
+
+
+def record_size(flags: int) -> int:
+    return NUMBERS_SIZE + GIVENS_SIZE + (NOTES_SIZE if flags & FLAG_NOTES else 0)
+
+
+def encode_record(record: PuzzleRecord, flags: int) -> bytes:
+    data = pack_numbers(record.line) + record.givens.to_bytes(GIVENS_SIZE, "little")
+    if flags & FLAG_NOTES:
+        notes = record.notes if record.notes is not None else array("H", bytes(NOTES_SIZE))
+        if sys.byteorder == "big":
+            notes = notes[:]
+            notes.byteswap()
+        data += notes.tobytes()
+    return data
+
+
+def decode_record(data: bytes, flags: int) -> PuzzleRecord:
+    line = unpack_numbers(data[:NUMBERS_SIZE])
+    givens = int.from_bytes(data[NUMBERS_SIZE:NUMBERS_SIZE + GIVENS_SIZE], "little")
+    notes = None
+    if flags & FLAG_NOTES:
+        notes = array("H", data[NUMBERS_SIZE + GIVENS_SIZE:])
+        if sys.byteorder == "big":
+            notes.byteswap()
+    return PuzzleRecord(line, givens, notes)
+
+
+def read_header(f: BinaryIO) -> int:
+    header = f.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError("truncated packed puzzle file")
+    magic, version, flags = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a packed puzzle file")
+    return flags
+
+
+# yield the records of a packed file, the header included in 'f'
+def iter_packed(f: BinaryIO) -> Iterator[PuzzleRecord]:
+    flags = read_header(f)
+    size = record_size(flags)
+    while True:
+        chunk = f.read(size * READ_BATCH)
+        if len(chunk) % size != 0:
+            raise ValueError("truncated packed puzzle file")
+        for offset in range(0, len(chunk), size):
+            yield decode_record(chunk[offset:offset + size], flags)
+        if len(chunk) < size * READ_BATCH:
+            return
+
+
+class PackedWriter:
+    f: BinaryIO
+    flags: int
+    count: int
+    __buffer: list[bytes]
+
+    def __init__(self, f: BinaryIO, with_notes: bool = False):
+        self.f = f
+        self.flags = FLAG_NOTES if with_notes else 0
+        self.count = 0
+        self.__buffer = []
+        f.write(HEADER.pack(MAGIC, VERSION, self.flags))
+
+    def write(self, record: PuzzleRecord):
+        self.__buffer.append(encode_record(record, self.flags))
+        self.count += 1
+        if len(self.__buffer) == READ_BATCH:
+            self.flush()
+
+    def write_all(self, records: Iterable[PuzzleRecord]) -> int:
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def flush(self):
+        self.f.write(b"".join(self.__buffer))
+        self.__buffer.clear()
+        self.f.flush()
+
+    def __enter__(self) -> "PackedWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def is_packed(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# stream the records of a file in either format, detected from its contents
+def read_puzzles(path: str) -> Iterator[PuzzleRecord]:
+    if is_packed(path):
+        with open(path, "rb") as f:
+            yield from iter_packed(f)
+    else:
+        with open(path) as f:
+            yield from iter_lines(f)
+
+
+# stream the puzzle of every record of a file in either format, '-' for
+# lines on stdin. Lines are passed on unchecked, so the caller decides what
+# a malformed one means instead of the whole read failing on it.
+def read_puzzle_lines(path: str) -> Iterator[str]:
+    if path == "-":
+        yield from iter_raw_lines(sys.stdin)
+    elif is_packed(path):
+        yield from (record.puzzle() for record in read_puzzles(path))
+    else:
+        with open(path) as f:
+            yield from iter_raw_lines(f)
+
+
+# write records to 'path', packed if 'packed' is set, as lines otherwise
+def write_puzzles(path: str, records: Iterable[PuzzleRecord], packed: bool, with_notes: bool = False) -> int:
+    if packed:
+        with open(path, "wb") as f, PackedWriter(f, with_notes) as writer:
+            return writer.write_all(records)
+    with open(path, "w") as f:
+        return write_lines(f, records)
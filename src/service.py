@@ -0,0 +1,498 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, NamedTuple, Optional
+from sudoku import SudokuState, Difficulty
+from geometry import geometry_for_cells
+from solve_stats import percentiles
+from batch import SOLVERS, SolveResult, generate_chunk, solve_chunk
+
+# Line protocol over TCP on localhost: every request is one JSON object on
+# its own line, answered by one JSON line carrying the same "id". Requests
+# on a connection may be pipelined and are answered as they complete.
+#
+#   {"id": 1, "op": "generate", "difficulty": "HARD", "count": 1, "box_size": 3}
+#       -> {"id": 1, "ok": true, "puzzles": ["..."]}
+#   {"id": 2, "op": "solve", "puzzle": "...", "solver": "dlx_solve", "timeout": 5}
+#       -> {"id": 2, "ok": true, "status": "solved", "solution": "...", "nodes": 42}
+#   {"id": 3, "op": "validate", "puzzle": "..."}
+#       -> {"id": 3, "ok": true, "conflict": false, "solved": false, "solutions": 1}
+#   {"id": 4, "op": "hint", "puzzle": "..."}
+#       -> {"id": 4, "ok": true, "hint": "...", "placement": [row, col, n], "eliminations": [[row, col, n]],
+#           "steps": ["...", "..."]}
+#   {"id": 5, "op": "stats"}
+#       -> {"id": 5, "ok": true, "queue_depth": 0, ..., "latency_ms": {"solve": {"p50": ...}}}
+#
+# A hint is the next placement along with the eliminations it needs; 'hint'
+# describes the last of 'steps', a placement unless deductions run out.
+# A failed request gets {"id": ..., "ok": false, "error": "..."}. Puzzles are
+# lines of one character per cell, '0' or '.' for an empty cell, of any size
+# SudokuState supports (box_size 2-5, 9x9 by default); 'solutions' counts
+# up to 2. Everything but stats runs in a process pool, and solve
+# requests arriving together are sent to it as one task.
+#
+# No request keeps a worker busy for long: a solve without a "timeout", or
+# with one above the server's --max-timeout, gets the maximum, and validate
+# and hint are stopped after it too, failing with a TimeoutError.
+DEFAULT_PORT = 8765
+# solve requests per pool task at most
+DEFAULT_BATCH_SIZE = 32
+# how long the first solve request of a batch waits for company, in seconds
+DEFAULT_BATCH_DELAY = 0.002
+MAX_GENERATE_COUNT = 100
+# seconds of work a solve, validate or hint request gets at most
+DEFAULT_MAX_TIMEOUT = 10.0
+# latency samples kept per operation
+LATENCY_WINDOW = 10000
+
+
+# a should_stop callable turning true 'timeout' seconds from now, None
+# without a timeout
+def _deadline(timeout: Optional[float]) -> Optional[Callable[[], bool]]:
+    if timeout is None:
+        return None
+    deadline = time.perf_counter() + timeout
+    return lambda: time.perf_counter() > deadline
+
+
+def validate_line(line: str, timeout: Optional[float] = None) -> dict[str, Any]:
+    state = SudokuState.from_line(line)
+    conflict = state.has_conflict()
+    solutions = 0 if conflict else state.count_solutions(2, _deadline(timeout))
+    if solutions < 0:
+        raise TimeoutError(f"counting solutions took over {timeout}s")
+    return {
+        "conflict": conflict,
+        "solved": state.is_solved(),
+        "solutions": solutions,
+    }
+
+
+def hint_line(line: str, timeout: Optional[float] = None) -> dict[str, Any]:
+    state = SudokuState.from_line(line)
+    should_stop = _deadline(timeout)
+    steps = state.hint(should_stop)
+    if should_stop is not None and should_stop():
+        raise TimeoutError(f"finding a hint took over {timeout}s")
+    if len(steps) == 0:
+        return {"hint": None, "placement": None, "eliminations": [], "steps": []}
+    size = state.size
+    placement = None
+    if steps[-1].placement is not None:
+        (i, n) = steps[-1].placement
+        placement = [i // size, i % size, n]
+    return {
+        "hint": steps[-1].describe(size),
+        "placement": placement,
+        "eliminations": [[i // size, i % size, n] for step in steps for (i, n) in step.eliminations],
+        "steps": [step.describe(size) for step in steps],
+    }
+
+
+# whether 'solution' fills every empty cell of 'puzzle' without a conflict
+def check_solution(puzzle: str, solution: str) -> bool:
+    if len(solution) != len(puzzle) or not SudokuState.from_line(solution).is_solved():
+        return False
+    return all(p in "0." or p == s for p, s in zip(puzzle, solution))
+
+
+def _check_puzzle(request: dict[str, Any]) -> str:
+    line = request.get("puzzle")
+    if not isinstance(line, str):
+        raise ValueError("missing puzzle")
+    # raises ValueError on a bad length or character
+    geometry_for_cells(len(line)).parse_line(line)
+    return line
+
+
+class _PendingSolve(NamedTuple):
+    line: str
+    future: asyncio.Future
+
+
+# Collects solve requests sharing a solver and a timeout, and sends them to
+# the pool as one task once 'batch_size' are waiting or 'batch_delay' has
+# passed since the first one, whichever comes first. Timeouts are capped at
+# 'max_timeout', which is also the timeout of requests without one, so no
+# puzzle of a batch can hold up the others indefinitely.
+class SolveBatcher:
+    pool: ProcessPoolExecutor
+    batch_size: int
+    batch_delay: float
+    max_timeout: float
+    # requests waiting for their batch to leave
+    waiting: int
+    # requests in batches the pool is working on
+    running: int
+    batches: int
+    batched_requests: int
+    __open: dict[tuple[str, float], list[_PendingSolve]]
+
+    def __init__(self, pool: ProcessPoolExecutor, batch_size: int, batch_delay: float,
+                 max_timeout: float = DEFAULT_MAX_TIMEOUT):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_timeout = max_timeout
+        self.waiting = 0
+        self.running = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.__open = {}
+
+    async def solve(self, line: str, solver: str, timeout: Optional[float]) -> SolveResult:
+        loop = asyncio.get_running_loop()
+        key = (solver, self.max_timeout if timeout is None else min(timeout, self.max_timeout))
+        batch = self.__open.get(key)
+        if batch is None:
+            batch = self.__open[key] = []
+            loop.call_later(self.batch_delay, self.__flush, key, batch)
+        pending = _PendingSolve(line, loop.create_future())
+        batch.append(pending)
+        self.waiting += 1
+        if len(batch) >= self.batch_size:
+            self.__flush(key, batch)
+        return await pending.future
+
+    def __flush(self, key: tuple[str, float], batch: list[_PendingSolve]):
+        # the delayed flush of a batch that already left on size finds it gone
+        if self.__open.get(key) is not batch:
+            return
+        del self.__open[key]
+        self.waiting -= len(batch)
+        self.running += len(batch)
+        self.batches += 1
+        self.batched_requests += len(batch)
+        (solver, timeout) = key
+        try:
+            task = asyncio.get_running_loop().run_in_executor(
+                self.pool, solve_chunk, [pending.line for pending in batch], solver, timeout)
+        except Exception as error:
+            # a pool that is shut down or broken refuses the task outright
+            self.running -= len(batch)
+            self.__fail(batch, error)
+            return
+        task.add_done_callback(lambda done: self.__deliver(batch, done))
+
+    def __deliver(self, batch: list[_PendingSolve], done: asyncio.Future):
+        self.running -= len(batch)
+        error = done.exception()
+        if error is not None:
+            self.__fail(batch, error)
+            return
+        for pending, result in zip(batch, done.result()):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    def __fail(self, batch: list[_PendingSolve], error: BaseException):
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+
+
+class PuzzleService:
+    pool: ProcessPoolExecutor
+    batcher: SolveBatcher
+    # pool tasks other than solve batches
+    running: int
+    requests: Counter
+    errors: Counter
+    latency: dict[str, deque[float]]
+    started: float
+    max_timeout: float
+
+    def __init__(self, workers: int, batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_delay: float = DEFAULT_BATCH_DELAY, max_timeout: float = DEFAULT_MAX_TIMEOUT):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.batcher = SolveBatcher(self.pool, batch_size, batch_delay, max_timeout)
+        self.max_timeout = max_timeout
+        self.running = 0
+        self.requests = Counter()
+        self.errors = Counter()
+        self.latency = {}
+        self.started = time.monotonic()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def __in_pool(self, fn, *args):
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        finally:
+            self.running -= 1
+
+    async def __generate(self, request: dict[str, Any]) -> dict[str, Any]:
+        difficulty = Difficulty[request.get("difficulty", Difficulty.EASY.name)]
+        count = int(request.get("count", 1))
+        if not 1 <= count <= MAX_GENERATE_COUNT:
+            raise ValueError(f"count must be between 1 and {MAX_GENERATE_COUNT}")
+        box_size = int(request.get("box_size", 3))
+        puzzles = await self.__in_pool(generate_chunk, random.getrandbits(64), count, difficulty, False, box_size)
+        return {"puzzles": puzzles}
+
+    async def __solve(self, request: dict[str, Any]) -> dict[str, Any]:
+        line = _check_puzzle(request)
+        solver = request.get("solver", "dlx_solve")
+        if solver not in SOLVERS:
+            raise ValueError(f"unknown solver {solver}")
+        timeout = request.get("timeout")
+        if timeout is not None:
+            timeout = float(timeout)
+            if not timeout > 0:
+                raise ValueError("timeout must be positive")
+        result = await self.batcher.solve(line, solver, timeout)
+        return {
+            "status": result.status,
+            "solution": result.line if result.status == "solved" else None,
+            "nodes": result.nodes,
+            "solve_ms": result.seconds * 1000,
+        }
+
+    async def __validate(self, request: dict[str, Any]) -> dict[str, Any]:
+        return await self.__in_pool(validate_line, _check_puzzle(request), self.max_timeout)
+
+    async def __hint(self, request: dict[str, Any]) -> dict[str, Any]:
+        return await self.__in_pool(hint_line, _check_puzzle(request), self.max_timeout)
+
+    def stats(self) -> dict[str, Any]:
+        batcher = self.batcher
+        return {
+            "uptime": time.monotonic() - self.started,
+            "queue_depth": batcher.waiting + batcher.running + self.running,
+            "solve_waiting": batcher.waiting,
+            "solve_running": batcher.running,
+            "other_running": self.running,
+            "batches": batcher.batches,
+            "mean_batch": batcher.batched_requests / batcher.batches if batcher.batches != 0 else 0,
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "latency_ms": {op: {key: value * 1000 if key != "n" else value
+                                for key, value in percentiles(list(samples)).items()}
+                           for op, samples in self.latency.items() if len(samples) != 0},
+        }
+
+    async def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        op = request.get("op")
+        handlers = {
+            "generate": self.__generate,
+            "solve": self.__solve,
+            "validate": self.__validate,
+            "hint": self.__hint,
+        }
+        start = time.perf_counter()
+        # any failure, a bad request or a broken pool alike, is answered
+        # rather than left to end the connection task without a reply
+        try:
+            if not isinstance(op, str):
+                raise ValueError(f"op must be a string, got {op!r}")
+            self.requests[op] += 1
+            if op == "stats":
+                response = self.stats()
+            elif op in handlers:
+                response = await handlers[op](request)
+            else:
+                raise ValueError(f"unknown op {op}")
+        except Exception as error:
+            self.errors[op if isinstance(op, str) else None] += 1
+            return {"id": request.get("id"), "ok": False, "error": f"{type(error).__name__}: {error}"}
+        self.latency.setdefault(op, deque(maxlen=LATENCY_WINDOW)).append(time.perf_counter() - start)
+        return {"id": request.get("id"), "ok": True, **response}
+
+    async def __answer(self, line: bytes, writer: asyncio.StreamWriter):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request is not an object")
+        except ValueError as error:
+            response = {"id": None, "ok": False, "error": f"bad request: {error}"}
+        else:
+            response = await self.handle(request)
+        if not writer.is_closing():
+            writer.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip() == b"":
+                    continue
+                task = asyncio.create_task(self.__answer(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                await writer.drain()
+            if len(tasks) != 0:
+                await asyncio.wait(tasks)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve(args: argparse.Namespace):
+    service = PuzzleService(args.workers, args.batch_size, args.batch_delay, args.max_timeout)
+    server = await asyncio.start_server(service.serve_connection, args.host, args.port)
+    print(f"serving on {args.host}:{args.port} with {args.workers} workers", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def _cmd_serve(args: argparse.Namespace):
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+# A client connection that pipelines requests and matches the answers by id
+class Client:
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    next_id: int
+    __waiting: dict[int, asyncio.Future]
+    __receiver: asyncio.Task
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.__waiting = {}
+        self.__receiver = asyncio.create_task(self.__receive())
+
+    @staticmethod
+    async def connect(host: str, port: int) -> "Client":
+        reader, writer = await asyncio.open_connection(host, port)
+        return Client(reader, writer)
+
+    async def __receive(self):
+        while line := await self.reader.readline():
+            response = json.loads(line)
+            future = self.__waiting.pop(response.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(response)
+        for future in self.__waiting.values():
+            if not future.done():
+                future.set_exception(ConnectionError("connection closed"))
+
+    async def request(self, op: str, **fields) -> dict[str, Any]:
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.__waiting[self.next_id] = future
+        self.writer.write(json.dumps({"id": self.next_id, "op": op, **fields}).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.__receiver.cancel()
+
+
+async def _load(args: argparse.Namespace):
+    clients = [await Client.connect(args.host, args.port) for _ in range(args.connections)]
+    if args.input is not None:
+        with open(args.input) as f:
+            puzzles = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    else:
+        response = await clients[0].request("generate", difficulty=args.difficulty, count=args.puzzles,
+                                            box_size=args.box_size)
+        if not response["ok"]:
+            raise SystemExit(f"generate failed: {response['error']}")
+        puzzles = response["puzzles"]
+
+    ops = args.op.split(",")
+    samples: dict[str, list[float]] = {op: [] for op in ops}
+    failures: Counter = Counter()
+    remaining = iter(range(args.requests))
+
+    # every worker keeps 'pipeline' requests in flight on its connection
+    async def worker(client: Client):
+        for k in remaining:
+            op = ops[k % len(ops)]
+            puzzle = puzzles[k % len(puzzles)]
+            if op == "generate":
+                fields = {"difficulty": args.difficulty, "box_size": args.box_size}
+            else:
+                fields = {"puzzle": puzzle}
+            start = time.perf_counter()
+            response = await client.request(op, **fields)
+            samples[op].append(time.perf_counter() - start)
+            if not response["ok"]:
+                failures[response["error"]] += 1
+            elif op == "solve" and response["status"] == "solved":
+                if not check_solution(puzzle, response["solution"]):
+                    failures["wrong solution"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(client) for client in clients for _ in range(args.pipeline)))
+    elapsed = time.perf_counter() - start
+    server_stats = await clients[0].request("stats")
+    for client in clients:
+        await client.close()
+
+    total = sum(len(s) for s in samples.values())
+    print(f"{total} requests in {elapsed:.2f}s, {total / elapsed:.1f} requests/s, "
+          f"{args.connections} connections x {args.pipeline} in flight", file=sys.stderr)
+    for op, op_samples in samples.items():
+        if len(op_samples) != 0:
+            summary = percentiles(op_samples)
+            print(f"{op}: " + ", ".join(f"{key} {summary[key] * 1000:.3f}ms"
+                                        for key in ("mean", "p50", "p90", "p99", "max")), file=sys.stderr)
+    for error, count in failures.items():
+        print(f"{count} failed: {error}", file=sys.stderr)
+    print(json.dumps(server_stats, ensure_ascii=False, indent=2))
+
+
+def _cmd_load(args: argparse.Namespace):
+    asyncio.run(_load(args))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="service", description="local sudoku puzzle service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="serve generate/solve/validate/hint requests")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    serve_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                              help="solve requests per pool task at most")
+    serve_parser.add_argument("--batch-delay", type=float, default=DEFAULT_BATCH_DELAY,
+                              help="seconds a solve request waits for others to batch with")
+    serve_parser.add_argument("--max-timeout", type=float, default=DEFAULT_MAX_TIMEOUT,
+                              help="seconds of work a solve, validate or hint request gets at most")
+    serve_parser.set_defaults(handler=_cmd_serve)
+
+    load_parser = commands.add_parser("load", help="load-test a running service")
+    load_parser.add_argument("--host", default="127.0.0.1")
+    load_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    load_parser.add_argument("--requests", type=int, default=1000)
+    load_parser.add_argument("--connections", type=int, default=4)
+    load_parser.add_argument("--pipeline", type=int, default=8, help="requests in flight per connection")
+    load_parser.add_argument("--op", default="solve",
+                             help="comma-separated ops to cycle through: generate, solve, validate, hint")
+    load_parser.add_argument("--input", default=None,
+                             help="file of puzzle lines to send, generated by the service if missing")
+    load_parser.add_argument("--puzzles", type=int, default=20, help="puzzles to generate without --input")
+    load_parser.add_argument("--difficulty", choices=[d.name for d in Difficulty], default=Difficulty.HARD.name)
+    load_parser.add_argument("--box-size", type=int, default=3,
+                             help="box size of the puzzles to generate, 4 for 16x16")
+    load_parser.set_defaults(handler=_cmd_load)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
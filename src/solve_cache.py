@@ -0,0 +1,105 @@
+import dbm
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Optional
+from sudoku import SudokuState
+from geometry import STANDARD
+from solve_stats import SolveStats
+import symmetry
+
+# Solutions keyed by the canonical form of the board they solve (see
+# symmetry.canonical_form), so a puzzle hits the cache when the same board
+# up to band and stack order, transposition and digit labels was solved
+# before; row or column swaps inside a band or stack make a new key. The
+# key and the value are both 81 bytes in canonical coordinates; a hit is
+# mapped back through the board's own transform. The memory tier is an LRU
+# bounded by 'max_entries'; with a 'path' every solution is also written to
+# a dbm file, which is read on a memory miss and survives restarts.
+class SolveCache:
+    max_entries: int
+    path: Optional[str]
+    hits: int
+    misses: int
+    lock: threading.Lock
+    __memory: OrderedDict[bytes, bytes]
+    __disk: Optional["dbm._Database"]
+
+    def __init__(self, max_entries: int = 10000, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.__memory = OrderedDict()
+        self.__disk = dbm.open(path, "c") if path is not None else None
+
+    # the canonical solution stored under 'key', None on a miss
+    def get(self, key: bytes) -> Optional[bytes]:
+        with self.lock:
+            solution = self.__memory.get(key)
+            if solution is not None:
+                self.__memory.move_to_end(key)
+            elif self.__disk is not None:
+                solution = self.__disk.get(key)
+                if solution is not None:
+                    self.__remember(key, solution)
+            if solution is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return solution
+
+    def put(self, key: bytes, solution: bytes):
+        with self.lock:
+            self.__remember(key, solution)
+            if self.__disk is not None:
+                self.__disk[key] = solution
+
+    def __remember(self, key: bytes, solution: bytes):
+        self.__memory[key] = solution
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.max_entries:
+            self.__memory.popitem(last=False)
+
+    # the solved grid of 'numbers' in its own coordinates, None on a miss
+    def lookup(self, numbers: bytes) -> Optional[bytes]:
+        key, transform = symmetry.canonical_form(numbers)
+        solution = self.get(key)
+        return transform.invert(solution) if solution is not None else None
+
+    def store(self, numbers: bytes, grid: bytes):
+        key, transform = symmetry.canonical_form(numbers)
+        self.put(key, transform.apply(grid))
+
+    # run state.<solver> unless the board was solved before. Same contract as
+    # the solvers: (row, col, value) for every empty cell, [] if unsolved.
+    # Boards other than 9x9 are passed straight to the solver.
+    def solve(self, state: SudokuState, solver: str, stats: Optional[SolveStats] = None,
+              should_stop: Optional[Callable[[], bool]] = None) -> list[tuple[int, int, int]]:
+        stats = stats if stats is not None else SolveStats()
+        if state.geometry is not STANDARD:
+            return getattr(state, solver)(stats, should_stop)
+        numbers = bytes(state.numbers)
+        with stats.phase("cache"):
+            key, transform = symmetry.canonical_form(numbers)
+            cached = self.get(key)
+        if cached is not None:
+            stats.solver = solver
+            stats.done(True)
+            grid = transform.invert(cached)
+            return [(i // 9, i % 9, grid[i]) for i in range(81) if numbers[i] == 0]
+
+        solution = getattr(state, solver)(stats, should_stop)
+        if stats.solved:
+            grid = bytearray(numbers)
+            for (r, c, n) in solution:
+                grid[r * 9 + c] = n
+            self.put(key, transform.apply(grid))
+        return solution
+
+    def close(self):
+        with self.lock:
+            if self.__disk is not None:
+                self.__disk.close()
+                self.__disk = None
@@ -0,0 +1,89 @@
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+# called with an event name and the stats so far:
+#   "progress" every 'progress_interval' nodes,
+#   "phase"    when a phase ends,
+#   "done"     when the solver returns
+SolveObserver = Callable[[str, "SolveStats"], None]
+
+# solvers taking a 'should_stop' callable poll it once every this many nodes
+STOP_POLL_INTERVAL = 1024
+
+
+# search effort of one solver run. A node is one tentative assignment of a
+# digit to a cell (or one row chosen by DLX); a backtrack is a node undone
+# because nothing below it led to a solution. A deduction is one logical
+# step applied by constraint propagation.
+@dataclass
+class SolveStats:
+    solver: str = ""
+    solved: bool = False
+    cancelled: bool = False
+    nodes: int = 0
+    backtracks: int = 0
+    max_depth: int = 0
+    candidate_computations: int = 0
+    deductions: int = 0
+    phase_seconds: dict[str, float] = field(default_factory=dict)
+    observer: Optional[SolveObserver] = field(default=None, repr=False, compare=False)
+    progress_interval: int = field(default=1000, repr=False, compare=False)
+
+    def node(self, depth: int):
+        self.nodes += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.observer is not None and self.nodes % self.progress_interval == 0:
+            self.observer("progress", self)
+
+    def backtrack(self):
+        self.backtracks += 1
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + time.perf_counter() - start
+            if self.observer is not None:
+                self.observer("phase", self)
+
+    def done(self, solved: bool):
+        self.solved = solved
+        if self.observer is not None:
+            self.observer("done", self)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.phase_seconds.values())
+
+    # asdict() would deep-copy the observer and whatever it holds (a lock
+    # does not copy), so the fields are picked one by one
+    def as_dict(self) -> dict:
+        result = {f.name: getattr(self, f.name) for f in fields(self)
+                  if f.name not in ("observer", "progress_interval")}
+        result["phase_seconds"] = dict(self.phase_seconds)
+        result["total_seconds"] = self.total_seconds
+        return result
+
+
+# summary of a list of samples, as reported by the benchmark and batch tools
+def percentiles(samples: list) -> dict[str, float]:
+    ordered = sorted(samples)
+
+    def at(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {
+        "n": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "min": ordered[0],
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "max": ordered[-1],
+    }
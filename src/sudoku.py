@@ -1,35 +1,54 @@
-from dataclasses import dataclass
-from typing import Optional, cast
+from array import array
+from collections.abc import Callable
+from typing import Optional, Protocol
 from enum import Enum
 import random
-
-@dataclass
+import dlx
+import logic
+from geometry import Geometry, MaskArray, STANDARD, geometry as geometry_of_box, geometry_for_cells
+from solve_stats import SolveStats, SolveObserver, STOP_POLL_INTERVAL
+
+# A view of one cell of a SudokuState. The board itself lives in the
+# state's flat arrays, so a view is created on demand and costs nothing
+# to keep or throw away.
 class SudokuCell:
-    number: Optional[int]
-    notes: list[int]
-    coord: tuple[int, int]
-    is_fixed: bool
+    __slots__ = ("state", "index")
+    state: "SudokuState"
+    index: int
+
+    def __init__(self, state: "SudokuState", index: int):
+        self.state = state
+        self.index = index
+
+    @property
+    def number(self) -> Optional[int]:
+        return self.state.numbers[self.index] or None
+
+    @property
+    def notes(self) -> list[int]:
+        return logic.digits_of(self.state.notes[self.index])
+
+    @property
+    def coord(self) -> tuple[int, int]:
+        return divmod(self.index, self.state.geometry.size)
 
     def markfixed(self):
-        self.is_fixed = True
+        self.state.fixed |= 1 << self.index
 
     def markunfixed(self):
-        self.is_fixed = False
+        self.state.fixed &= ~(1 << self.index)
 
     def isfixed(self) -> bool:
-        return self.is_fixed
+        return self.state.fixed >> self.index & 1 == 1
 
     def addnote(self, n: int):
-        if n in self.notes:
-            return
-        self.notes.append(n)
+        self.state.notes[self.index] |= 1 << n
 
     def clrnote(self):
-        self.notes.clear()
+        self.state.notes[self.index] = 0
 
     def removenote(self, n: int):
-        if n in self.notes:
-            self.notes.remove(n)
+        self.state.notes[self.index] &= ~(1 << n)
 
 
 class Difficulty(Enum):
@@ -38,170 +57,576 @@ class Difficulty(Enum):
     HARD = 2
 
 
+# blanks of a 9x9 puzzle; other sizes blank the same share of their cells
 mapping_from_difficulty_to_nblank = {
     Difficulty.EASY: 27,
     Difficulty.NORMAL: 36,
     Difficulty.HARD: 54,
 }
 
+
+def nblank_of(difficulty: Difficulty, geometry: Geometry) -> int:
+    return mapping_from_difficulty_to_nblank[difficulty] * geometry.ncells // 81
+
+
+SNAPSHOT_FIXED_SIZE = 11
+# uniqueness checks while blanking a board larger than 9x9 give up after
+# this many batches of STOP_POLL_INTERVAL nodes; a check that gives up
+# keeps the clue, so the puzzle stays unique but may get fewer blanks
+BLANK_CHECK_POLLS = 1
+
+
+# Explicit-stack backtracking over the cells in 'empties', driven only by
+# the unit masks: level k of the stack assigns order[k], remaining[k] holds
+# the digits still to try there and chosen[k] the digit currently placed.
+# With 'mrv' the next level takes the unassigned cell with the fewest
+# candidates, otherwise cells are filled in the given order. With
+# 'randomize' the digits are tried in random order instead of ascending.
+#
+# Stops after 'limit' completions and returns how many were found, or -1
+# if 'should_stop' (polled every STOP_POLL_INTERVAL nodes) asked to stop.
+# The first completion is written to 'solution' as (cell, digit) pairs in
+# assignment order. The unit masks are restored before returning.
+def search_completions(row_mask: list[int], col_mask: list[int], box_mask: list[int],
+                       empties: list[int], limit: int, *,
+                       mrv: bool = True, randomize: bool = False,
+                       solution: Optional[list[tuple[int, int]]] = None,
+                       stats: Optional[SolveStats] = None,
+                       should_stop: Optional[Callable[[], bool]] = None,
+                       geometry: Geometry = STANDARD) -> int:
+    row_of, col_of, box_of, all_digits = geometry.row_of, geometry.col_of, geometry.box_of, geometry.all_digits
+    n = len(empties)
+    if n == 0:
+        if solution is not None:
+            solution.clear()
+        return 1
+
+    order = list(empties)
+    remaining = [0] * n
+    chosen = [0] * n
+    found = 0
+    nodes = 0
+
+    # move the cell to assign at 'depth' into order[depth] and return its candidates
+    def select(depth: int) -> int:
+        if stats is not None:
+            stats.candidate_computations += n - depth if mrv else 1
+        if not mrv:
+            i = order[depth]
+            return ~(row_mask[row_of[i]] | col_mask[col_of[i]] | box_mask[box_of[i]]) & all_digits
+        best_k, best_mask, best_count = depth, 0, geometry.size + 1
+        for k in range(depth, n):
+            i = order[k]
+            mask = ~(row_mask[row_of[i]] | col_mask[col_of[i]] | box_mask[box_of[i]]) & all_digits
+            count = mask.bit_count()
+            if count < best_count:
+                best_k, best_mask, best_count = k, mask, count
+                if count <= 1:
+                    break
+        order[depth], order[best_k] = order[best_k], order[depth]
+        return best_mask
+
+    def unwind():
+        for k in range(n):
+            bit = chosen[k]
+            if bit:
+                i = order[k]
+                row_mask[row_of[i]] ^= bit
+                col_mask[col_of[i]] ^= bit
+                box_mask[box_of[i]] ^= bit
+                chosen[k] = 0
+
+    depth = 0
+    remaining[0] = select(0)
+    while depth >= 0:
+        i = order[depth]
+        r, c, b = row_of[i], col_of[i], box_of[i]
+        bit = chosen[depth]
+        if bit:
+            # take back the digit tried at this level
+            row_mask[r] ^= bit
+            col_mask[c] ^= bit
+            box_mask[b] ^= bit
+            chosen[depth] = 0
+            if stats is not None:
+                stats.backtrack()
+
+        mask = remaining[depth]
+        if mask == 0:
+            depth -= 1
+            continue
+        if randomize:
+            for _ in range(random.randrange(mask.bit_count())):
+                mask &= mask - 1
+        bit = mask & -mask
+        remaining[depth] ^= bit
+        row_mask[r] |= bit
+        col_mask[c] |= bit
+        box_mask[b] |= bit
+        chosen[depth] = bit
+
+        nodes += 1
+        if stats is not None:
+            stats.node(depth + 1)
+        if should_stop is not None and nodes % STOP_POLL_INTERVAL == 0 and should_stop():
+            unwind()
+            return -1
+
+        if depth + 1 < n:
+            depth += 1
+            remaining[depth] = select(depth)
+            continue
+
+        # every cell is filled
+        found += 1
+        if found == 1 and solution is not None:
+            solution[:] = [(order[k], chosen[k].bit_length() - 1) for k in range(n)]
+        if found >= limit:
+            unwind()
+            return found
+    return found
+
+
+# count the ways to fill the cells in 'empties', stopping once 'limit' is
+# reached. The unit masks are modified during the search but restored
+# before returning.
+def count_completions(row_mask: list[int], col_mask: list[int], box_mask: list[int],
+                      empties: list[int], limit: int, geometry: Geometry = STANDARD,
+                      should_stop: Optional[Callable[[], bool]] = None) -> int:
+    return search_completions(row_mask, col_mask, box_mask, empties, limit,
+                              geometry=geometry, should_stop=should_stop)
+
+
+# somewhere restart can take ready-made puzzles from instead of generating them
+class PuzzleSource(Protocol):
+    # an 81-character puzzle line, or None if no puzzle is available right now
+    def draw(self, difficulty: Difficulty) -> Optional[str]: ...
+
+
+# A board of any supported size (see geometry.py), 9x9 unless a box size
+# is given. Cell indices, lines and masks follow the board's geometry;
+# snapshot() and restore() are 9x9 only, as are the puzzle bank, the
+# packed file format, the symmetry transforms and the vectorized checks.
 class SudokuState:
-    cells: list[list[SudokuCell]]
+    geometry: Geometry
+    # cell numbers in row-major order, 0 for an empty cell
+    numbers: bytearray
+    # bit i is set if cell i is a given
+    fixed: int
+    # bit n of notes[i] is set if n is noted in cell i
+    notes: MaskArray
     difficulty: Difficulty
     total_blank: int
     residual_blank: int
-
-    def __init__(self, difficulty=Difficulty.EASY):
+    # occupancy bitmask of every unit (numbered as in Geometry.units): bit n
+    # is set if some cell of the unit holds n
+    unit_masks: list[int]
+    # how many cells of unit u hold digit n, at u * (size + 1) + n
+    unit_counts: bytearray
+    # surplus placements over all units: a unit holding a digit k times adds
+    # k - 1, so the board is conflict-free exactly when this is 0
+    conflicts: int
+    # candidate bitmask of every empty cell (0 for a filled one), kept up to
+    # date by the public moves so hints never rescan the board
+    candidates: MaskArray
+    # only consulted for 9x9 boards
+    source: Optional[PuzzleSource]
+
+    def __init__(self, difficulty=Difficulty.EASY, source: Optional[PuzzleSource] = None, box_size: int = 3):
+        self.geometry = geometry_of_box(box_size)
+        self.source = source
         self.restart(difficulty)
 
-    def number_is_valid(self, r: int, c: int, n: int):
-        if any(cell.number == n for cell in self.cells[r] if cell.coord[1] != c):
-            return False
-
-        if any(row[c].number == n for i, row in enumerate(self.cells) if i != r):
-            return False
+    @property
+    def size(self) -> int:
+        return self.geometry.size
 
-        start_row, start_col = 3 * (r // 3), 3 * (c // 3)
-        return not any(self.cells[i][j].number == n
-            for i in range(start_row, start_row + 3)
-            for j in range(start_col, start_col + 3) if i != r or j != c)
+    def number_is_valid(self, r: int, c: int, n: int):
+        g = self.geometry
+        i = r * g.size + c
+        # the cell itself does not conflict with its own number
+        own = 1 if self.numbers[i] == n else 0
+        (ru, cu, bu) = g.cell_units[i]
+        stride, counts = g.size + 1, self.unit_counts
+        return counts[ru * stride + n] == own and counts[cu * stride + n] == own and counts[bu * stride + n] == own
+
+    # whether the number in (r, c) clashes with another cell of its row, column or box
+    def is_conflicting(self, r: int, c: int) -> bool:
+        n = self.numbers[r * self.geometry.size + c]
+        return n != 0 and not self.number_is_valid(r, c, n)
+
+    def has_conflict(self) -> bool:
+        return self.conflicts != 0
+
+    def get_candidate_mask(self, row: int, col: int) -> int:
+        g = self.geometry
+        i = row * g.size + col
+        if self.numbers[i] != 0:
+            return sum(1 << n for n in g.digits() if self.number_is_valid(row, col, n))
+        (ru, cu, bu) = g.cell_units[i]
+        masks = self.unit_masks
+        return ~(masks[ru] | masks[cu] | masks[bu]) & g.all_digits
 
     def getpossible(self, row: int, col: int):
-        return [n for n in range(1, 10) if self.number_is_valid(row, col, n) ]
-
-    def __fill_cells(self, row: int, col: int) -> bool:
-        if row == 9:
-            return True
-
-        numberlist = self.getpossible(row, col) 
-        random.shuffle(numberlist)
-
-        next_col = col + 1 if col < 8 else 0
-        next_row = row if col < 8 else row + 1
-
-        for n in numberlist:
-            self.cells[row][col].number = n
-            if self.__fill_cells(next_row, next_col):
-                return True
-
-        # all possible numbers fail, reset it to None
-        self.cells[row][col].number = None
-        return False
-
-    def __next_to_be_filled(self, row, col) -> tuple[int, int]:
-        for c in range(col + 1, 9):
-            if self.get_cell(row, c).number is None:
-                return row, c
-        for r in range(row + 1, 9):
-            for c in range(0, 9):
-                if self.get_cell(r, c).number is None:
-                    return r, c
-        return 9, 0
-
-    def __ord_solve_aux(self, row, col, solution: list[tuple[int, int, int]]) -> bool:
-        if row == 9:
+        return logic.digits_of(self.get_candidate_mask(row, col))
+
+    def __count_digit(self, row: int, col: int, n: int, delta: int):
+        g = self.geometry
+        stride, counts, masks = g.size + 1, self.unit_counts, self.unit_masks
+        for u in g.cell_units[row * g.size + col]:
+            k = u * stride + n
+            before = counts[k]
+            counts[k] = before + delta
+            self.conflicts += max(before + delta - 1, 0) - max(before - 1, 0)
+            if counts[k] == 0:
+                masks[u] &= ~(1 << n)
+            else:
+                masks[u] |= 1 << n
+
+    # fresh copies of the row, column and box masks, for search_completions
+    def __masks_by_kind(self) -> tuple[list[int], list[int], list[int]]:
+        size, masks = self.geometry.size, self.unit_masks
+        return masks[:size], masks[size:2 * size], masks[2 * size:]
+
+    # write a number into an empty cell, keeping the unit masks up to date
+    def __place(self, row: int, col: int, n: int):
+        self.numbers[row * self.geometry.size + col] = n
+        self.__count_digit(row, col, n, 1)
+
+    # empty a filled cell, keeping the unit masks up to date
+    def __remove(self, row: int, col: int):
+        i = row * self.geometry.size + col
+        n = self.numbers[i]
+        self.numbers[i] = 0
+        self.__count_digit(row, col, n, -1)
+
+    # fill every cell of an empty board with a random valid grid
+    def __fill_cells(self) -> bool:
+        g = self.geometry
+        if g is not STANDARD:
+            self.__fill_cells_by_pattern()
             return True
-
-        possible = self.getpossible(row, col) 
-
-        next_row, next_col = self.__next_to_be_filled(row, col)
-        old_value = self.get_cell(row, col).number
-
-        for n in possible:
-            self.cells[row][col].number = n
-            if self.__ord_solve_aux(next_row, next_col, solution):
-                self.get_cell(row, col).number = old_value
-                solution.append((row, col, n))
-                return True
-
-        # all possible numbers fail, reset it to original value
-        self.get_cell(row, col).number = old_value
-        return False
-
-    def ord_solve(self) -> list[tuple[int, int, int]]:
+        solution: list[tuple[int, int]] = []
+        if search_completions(*self.__masks_by_kind(), list(range(81)), 1,
+                              mrv=False, randomize=True, solution=solution) != 1:
+            return False
+        for (i, n) in solution:
+            self.__place(i // 9, i % 9, n)
+        return True
+
+    # A random search fill stalls on large boards, so they start from the
+    # shifted-rows pattern grid and shuffle it with validity-preserving
+    # moves: bands, rows within a band, stacks, columns within a stack and
+    # the digit labels.
+    def __fill_cells_by_pattern(self):
+        box, size = self.geometry.box, self.geometry.size
+
+        def line_order() -> list[int]:
+            bands = random.sample(range(box), box)
+            return [box * b + k for b in bands for k in random.sample(range(box), box)]
+
+        rows, cols = line_order(), line_order()
+        labels = random.sample(range(1, size + 1), size)
+        for r in range(size):
+            for c in range(size):
+                pr, pc = rows[r], cols[c]
+                self.__place(r, c, labels[(box * (pr % box) + pr // box + pc) % size])
+
+    # run the backtracking search over the empty cells without touching the
+    # board; 'mrv' picks the most constrained cell first (opt_solve) instead
+    # of going in row-major order (ord_solve)
+    def __backtrack_solve(self, mrv: bool, stats: SolveStats,
+                          should_stop: Optional[Callable[[], bool]]) -> list[tuple[int, int, int]]:
+        if self.has_conflict():
+            # a full board would otherwise count as its own completion
+            stats.done(False)
+            return []
+        solution: list[tuple[int, int]] = []
+        with stats.phase("search"):
+            found = search_completions(*self.__masks_by_kind(), self.__empty_cells(), 1,
+                                       mrv=mrv, solution=solution, stats=stats, should_stop=should_stop,
+                                       geometry=self.geometry)
+        stats.cancelled = found < 0
+        stats.done(found == 1)
+        size = self.geometry.size
+        return [(i // size, i % size, n) for (i, n) in solution] if found == 1 else []
+
+    def ord_solve(self, stats: Optional[SolveStats] = None,
+                  should_stop: Optional[Callable[[], bool]] = None) -> list[tuple[int, int, int]]:
+        stats = stats if stats is not None else SolveStats()
+        stats.solver = "ord_solve"
+        return self.__backtrack_solve(False, stats, should_stop)
+
+    def opt_solve(self, stats: Optional[SolveStats] = None,
+                  should_stop: Optional[Callable[[], bool]] = None) -> list[tuple[int, int, int]]:
+        stats = stats if stats is not None else SolveStats()
+        stats.solver = "opt_solve"
+        return self.__backtrack_solve(True, stats, should_stop)
+
+    def dlx_solve(self, stats: Optional[SolveStats] = None,
+                  should_stop: Optional[Callable[[], bool]] = None) -> list[tuple[int, int, int]]:
+        stats = stats if stats is not None else SolveStats()
+        stats.solver = "dlx_solve"
+        if self.has_conflict():
+            stats.done(False)
+            return []
+        numbers, size = self.numbers, self.geometry.size
         solution = []
-        r, c = self.__next_to_be_filled(0, -1)
-        self.__ord_solve_aux(r, c, solution)
-        solution.reverse()
+        for grid in dlx.solve_sudoku(numbers, stats, should_stop, self.geometry):
+            solution = [(i // size, i % size, grid[i]) for i in range(self.geometry.ncells) if numbers[i] == 0]
+            break
+        stats.done(len(solution) != 0 or self.residual_blank == 0)
         return solution
 
-    def __opt_solve_aux_get_optimized_cell(self) -> Optional[tuple[int, int, list[int]]]:
-        allpossible = [(r, c, self.getpossible(r, c))
-            for r in range(0, 9)
-            for c in range(0, 9)
-            if self.get_cell(r, c).number is None]
-        return min(allpossible, key=lambda t: len(t[2])) if len(allpossible) != 0 else None
+    # constraint propagation with backtracking only when stuck. The solution
+    # lists the placements in the order they were deduced.
+    def logic_solve(self, stats: Optional[SolveStats] = None,
+                    should_stop: Optional[Callable[[], bool]] = None) -> list[tuple[int, int, int]]:
+        stats = stats if stats is not None else SolveStats()
+        stats.solver = "logic_solve"
+        with stats.phase("search"):
+            placed = logic.solve(self.numbers, stats, should_stop, self.geometry)
+        stats.done(placed is not None)
+        size = self.geometry.size
+        return [(i // size, i % size, n) for (i, n) in placed] if placed is not None else []
+
+    # run one of the solvers ("ord_solve", "opt_solve", "dlx_solve" or "logic_solve") and
+    # report its search effort along with the solution
+    def solve_with_stats(self, solver: str, observer: Optional[SolveObserver] = None,
+                         progress_interval: int = 1000) -> tuple[list[tuple[int, int, int]], SolveStats]:
+        stats = SolveStats(observer=observer, progress_interval=progress_interval)
+        solvers = {
+            "ord_solve": self.ord_solve,
+            "opt_solve": self.opt_solve,
+            "dlx_solve": self.dlx_solve,
+            "logic_solve": self.logic_solve,
+        }
+        return solvers[solver](stats), stats
+
+    def __empty_cells(self) -> list[int]:
+        return [i for i in range(self.geometry.ncells) if self.numbers[i] == 0]
+
+    # count the solutions of the current board, stopping at 'limit'; -1 if
+    # 'should_stop' said so first
+    def count_solutions(self, limit: int = 2, should_stop: Optional[Callable[[], bool]] = None) -> int:
+        if self.has_conflict():
+            return 0
+        return count_completions(*self.__masks_by_kind(), self.__empty_cells(), limit, self.geometry, should_stop)
+
+    # whether the board still solves with (row, col) holding a number other than 'n'.
+    # the cell must be empty and the board must have a solution with 'n' there.
+    def __has_other_solution(self, row: int, col: int, n: int) -> bool:
+        alternatives = self.get_candidate_mask(row, col) & ~(1 << n)
+        if alternatives == 0:
+            return False
 
-    def __opt_solve_aux(self, solution: list[tuple[int, int, int]]) -> bool:
-        optimized_cell = self.__opt_solve_aux_get_optimized_cell()
-        if optimized_cell is None:
-            return True
-        
-        (r, c, ns) = optimized_cell
-        old_value = self.get_cell(r, c).number
-
-        for n in ns:
-            self.get_cell(r, c).number = n
-            if self.__opt_solve_aux(solution):
-                self.get_cell(r, c).number = old_value
-                solution.append((r, c, n))
+        # neither when no other empty cell of one of its units can take 'n'
+        g = self.geometry
+        i, bit = row * g.size + col, 1 << n
+        cell_units, masks = g.cell_units, self.unit_masks
+        for u in cell_units[i]:
+            if all(self.numbers[j] != 0
+                   or (masks[cell_units[j][0]] | masks[cell_units[j][1]] | masks[cell_units[j][2]]) & bit
+                   for j in g.units[u] if j != i):
+                return False
+
+        row_mask, col_mask, box_mask = self.__masks_by_kind()
+        empties = [j for j in self.__empty_cells() if j != i]
+        b = g.box_index(row, col)
+        for d in logic.digits_of(alternatives):
+            should_stop = None
+            if g is not STANDARD:
+                polls = iter(range(BLANK_CHECK_POLLS))
+                should_stop = lambda: next(polls, None) is None
+            row_mask[row] |= 1 << d
+            col_mask[col] |= 1 << d
+            box_mask[b] |= 1 << d
+            # an unfinished check (-1) counts as another solution
+            found = count_completions(row_mask, col_mask, box_mask, empties, 1, g, should_stop) != 0
+            row_mask[row] ^= 1 << d
+            col_mask[col] ^= 1 << d
+            box_mask[b] ^= 1 << d
+            if found:
                 return True
-
-        self.get_cell(r, c).number = old_value
         return False
 
-    def opt_solve(self) -> list[tuple[int, int, int]]:
-        solution = []
-        self.__opt_solve_aux(solution)
-        solution.reverse()
-        return solution
-
-    def __set_blank(self, nblank: int):
-        blanks = [(r, c) for r in range(9) for c in range(9)]
+    # dig up to 'nblank' holes in a solved board, keeping the solution unique.
+    # returns the number of holes actually dug.
+    def __set_blank(self, nblank: int) -> int:
+        size = self.geometry.size
+        blanks = [(r, c) for r in range(size) for c in range(size)]
         random.shuffle(blanks)
-        for (r, c) in blanks[:nblank]:
-            self.cells[r][c].markunfixed()
-            self.cells[r][c].number = None
-
-    # initialize cells with 'nblank' empty cells
+        dug = 0
+        for (r, c) in blanks:
+            if dug == nblank:
+                break
+            n = self.numbers[r * size + c]
+            self.__remove(r, c)
+            if self.__has_other_solution(r, c, n):
+                # removing this clue makes the puzzle ambiguous, put it back
+                self.__place(r, c, n)
+                continue
+            self.fixed &= ~(1 << (r * size + c))
+            dug += 1
+        return dug
+
+    # initialize cells with at most 'nblank' empty cells
     def __init_cells(self, nblank: int):
-        self.__fill_cells(0, 0)
-        self.__set_blank(nblank)
+        self.__fill_cells()
+        self.total_blank = self.__set_blank(nblank)
+        self.residual_blank = self.total_blank
+
+    def __rebuild_candidates(self):
+        size = self.geometry.size
+        self.candidates = self.geometry.new_masks()
+        for i in range(self.geometry.ncells):
+            if self.numbers[i] == 0:
+                self.candidates[i] = self.get_candidate_mask(i // size, i % size)
+
+    # refresh the cached candidates of a cell that changed and of its peers
+    def __update_candidates(self, row: int, col: int):
+        size = self.geometry.size
+        i = row * size + col
+        for j in (i, *self.geometry.peers[i]):
+            self.candidates[j] = self.get_candidate_mask(j // size, j % size) if self.numbers[j] == 0 else 0
 
     def set_cell(self, row: int, col: int, n: int):
-        if self.cells[row][col].number is None:
+        if self.numbers[row * self.geometry.size + col] == 0:
             self.residual_blank -= 1
-        self.cells[row][col].number = n
+        else:
+            self.__remove(row, col)
+        self.__place(row, col, n)
+        self.__update_candidates(row, col)
 
     def get_cell(self, row: int, col: int) -> SudokuCell:
-        return self.cells[row][col]
+        return SudokuCell(self, row * self.geometry.size + col)
 
     def clr_cell(self, row: int, col: int):
-        assert not self.cells[row][col].isfixed()
+        i = row * self.geometry.size + col
+        assert not self.fixed >> i & 1
+        if self.numbers[i] == 0:
+            return
         self.residual_blank += 1
-        self.cells[row][col].number = None
+        self.__remove(row, col)
+        self.__update_candidates(row, col)
 
     def add_note(self, row: int, col: int, n: int):
-        self.cells[row][col].addnote(n)
+        self.notes[row * self.geometry.size + col] |= 1 << n
 
     def remove_note(self, row: int, col: int, n: int):
-        self.cells[row][col].removenote(n)
+        self.notes[row * self.geometry.size + col] &= ~(1 << n)
 
     def clr_note(self, row: int, col: int):
-        self.cells[row][col].clrnote()
+        self.notes[row * self.geometry.size + col] = 0
+
+    # replace the notes of a cell with all of its candidates
+    def fill_notes(self, row: int, col: int):
+        i = row * self.geometry.size + col
+        self.notes[i] = self.candidates[i]
+
+    # the deductions leading to the next number that can be placed, cheapest
+    # first: the eliminations it needs, then the placement. The list ends
+    # with an elimination when deductions run out before a placement, and
+    # is empty if there is none or the board contradicts itself. With
+    # 'should_stop', the steps found so far are returned once it says so.
+    def hint(self, should_stop: Optional[Callable[[], bool]] = None) -> list[logic.Step]:
+        if self.has_conflict():
+            return []
+        board = logic.LogicBoard.from_candidates(self.numbers, self.candidates, self.geometry)
+        steps = []
+        while (should_stop is None or not should_stop()) and (step := logic.next_step(board)) is not None:
+            steps.append(step)
+            if step.placement is not None:
+                break
+            board.apply(step)
+        return steps
+
+    # the board as a line of one character per cell in row-major order, '0'
+    # for an empty cell and 'A', 'B', ... for the numbers past 9
+    def to_line(self) -> str:
+        return self.geometry.format_line(self.numbers)
 
     def is_solved(self) -> bool:
-        if self.residual_blank != 0:
-            return False
-        return all(self.number_is_valid(r, c, cast(int, self.get_cell(r, c).number))
-            for r in range(9)
-            for c in range(9)
-            if not self.get_cell(r, c).isfixed())
-
-    def restart(self, difficulty: Difficulty):
+        return self.residual_blank == 0 and self.conflicts == 0
+
+    # the whole board as bytes: difficulty, total blanks, numbers, givens and notes.
+    # snapshots are hashable and restore() rebuilds the board from one. 9x9 only.
+    def snapshot(self) -> bytes:
+        assert self.geometry is STANDARD
+        return (bytes((self.difficulty.value, self.total_blank))
+            + self.numbers
+            + self.fixed.to_bytes(SNAPSHOT_FIXED_SIZE, "little")
+            + self.notes.tobytes())
+
+    def restore(self, snapshot: bytes):
+        self.geometry = STANDARD
+        self.__reset(Difficulty(snapshot[0]))
+        self.total_blank = snapshot[1]
+        numbers_end = 2 + 81
+        fixed_end = numbers_end + SNAPSHOT_FIXED_SIZE
+        self.residual_blank = 0
+        for i, n in enumerate(snapshot[2:numbers_end]):
+            if n != 0:
+                self.__place(i // 9, i % 9, n)
+            else:
+                self.residual_blank += 1
+        self.fixed = int.from_bytes(snapshot[numbers_end:fixed_end], "little")
+        self.notes = array("H", snapshot[fixed_end:])
+        self.__rebuild_candidates()
+
+    def copy(self) -> "SudokuState":
+        state = SudokuState.__new__(SudokuState)
+        state.geometry = self.geometry
+        state.source = self.source
+        state.difficulty = self.difficulty
+        state.total_blank, state.residual_blank = self.total_blank, self.residual_blank
+        state.numbers, state.fixed, state.notes = self.numbers[:], self.fixed, self.notes[:]
+        state.candidates = self.candidates[:]
+        state.unit_masks, state.unit_counts = self.unit_masks[:], self.unit_counts[:]
+        state.conflicts = self.conflicts
+        return state
+
+    def __reset(self, difficulty: Difficulty):
+        g = self.geometry
         self.difficulty = difficulty
-        self.total_blank = mapping_from_difficulty_to_nblank[difficulty]
+        self.numbers = bytearray(g.ncells)
+        self.fixed = g.all_cells
+        self.notes = g.new_masks()
+        self.unit_masks = [0] * (3 * g.size)
+        self.unit_counts = bytearray(3 * g.size * (g.size + 1))
+        self.conflicts = 0
+
+    # start over with the puzzle given as a line of one character per cell,
+    # '0' or '.' for an empty cell. The board size follows the line length.
+    def load(self, line: str, difficulty: Difficulty):
+        self.geometry = geometry_for_cells(len(line))
+        numbers = self.geometry.parse_line(line)
+        self.__reset(difficulty)
+        self.total_blank = 0
+        size = self.geometry.size
+        for i, n in enumerate(numbers):
+            if n == 0:
+                self.fixed &= ~(1 << i)
+                self.total_blank += 1
+            else:
+                self.__place(i // size, i % size, n)
         self.residual_blank = self.total_blank
-        self.cells = [[SudokuCell(number=None, notes=[], coord=(i, j), is_fixed=True)
-            for j in range(9)]
-            for i in range(9)]
-        self.__init_cells(self.total_blank)
+        self.__rebuild_candidates()
+
+    # a board holding the given puzzle, without generating one first
+    @staticmethod
+    def from_line(line: str, difficulty: Difficulty = Difficulty.EASY) -> "SudokuState":
+        state = SudokuState.__new__(SudokuState)
+        state.source = None
+        state.load(line, difficulty)
+        return state
+
+    def restart(self, difficulty: Difficulty):
+        use_source = self.source is not None and self.geometry is STANDARD
+        line = self.source.draw(difficulty) if use_source else None
+        if line is not None:
+            self.load(line, difficulty)
+            return
+        self.__reset(difficulty)
+        self.__init_cells(nblank_of(difficulty, self.geometry))
+        self.__rebuild_candidates()
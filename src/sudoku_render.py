@@ -1,5 +1,6 @@
 import tkinter as tk
 from sudoku import SudokuState
+from geometry import DIGIT_CHARS, Geometry
 from typing import Optional
 
 class SudokuRender:
@@ -7,7 +8,10 @@ class SudokuRender:
     sudokustate: SudokuState
     coord: tuple[int, int]
     cell_size: int
+    # width and height of the board in pixels
     size: int
+    # the board layout the canvas items were created for
+    geometry: Optional[Geometry]
     cell_color1: str
     cell_color2: str
     cell_color_selected: str
@@ -18,6 +22,12 @@ class SudokuRender:
     num_color_valid: str
     num_color_invalid: str
     selected_cell: Optional[tuple[int, int]]
+    # persistent canvas items, created by the first draw and then only reconfigured
+    rect_items: list[int]
+    number_items: list[int]
+    note_items: list[list[int]]
+    # what each cell currently shows: (fill color, number, number color, notes bitmask)
+    rendered: list[Optional[tuple[str, str, str, int]]]
 
     def __init__(self, canvas: tk.Canvas, sudokustate: SudokuState,
                  cell_size,
@@ -35,7 +45,8 @@ class SudokuRender:
         self.sudokustate = sudokustate
         self.coord = coord
         self.cell_size = cell_size
-        self.size = cell_size * 9
+        self.size = cell_size * sudokustate.geometry.size
+        self.geometry = None
         self.cell_color1 = cell_color1
         self.cell_color2 = cell_color2
         self.cell_color_selected = cell_color_selected
@@ -46,6 +57,10 @@ class SudokuRender:
         self.num_color_valid = num_color_valid
         self.num_color_invalid = num_color_invalid
         self.selected_cell = None
+        self.rect_items = []
+        self.number_items = []
+        self.note_items = []
+        self.rendered = []
 
         def on_click(event):
             x, y = event.x - self.coord[0], event.y - self.coord[1]
@@ -60,50 +75,51 @@ class SudokuRender:
 
         canvas.bind("<Button-1>", on_click)
 
-    def __clear(self):
-        self.canvas.delete("all")
-
-    def __draw_notes(self, row: int, col: int):
-        cell = self.sudokustate.get_cell(row, col)
-        x0, y0 = self.__get_cellpos(row, col)
-        x0, y0 = x0 + self.cell_size // 6, y0 + self.cell_size // 6
-        for number in cell.notes:
-            num_color = self.num_color_valid
-            offset_x, offset_y = self.__get_mini_number_offset(number)
-            self.canvas.create_text(x0 + offset_x, y0 + offset_y, text=number, anchor="center",
-                                    font=("Arial", self.cell_size // 5, "bold"), fill=num_color)
-
-    def __draw_fixed(self, row: int, col: int):
-        cell = self.sudokustate.get_cell(row, col)
-        assert cell.number is not None
-        number = cell.number
-        x0, y0 = self.__get_cellpos(row, col)
-        x0, y0 = x0 + self.cell_size // 2, y0 + self.cell_size // 2
-        self.canvas.create_text(x0, y0, text=number, anchor="center",
-                                font=("Arial", self.cell_size // 2, "bold"), fill=self.num_color_fixed)
-
-    def __draw_number(self, row: int, col: int, number: int):
-        color = self.num_color_valid if self.sudokustate.number_is_valid(row, col, number) else self.num_color_invalid
-        x0, y0 = self.__get_cellpos(row, col)
-        x0, y0 = x0 + self.cell_size // 2, y0 + self.cell_size // 2
-        self.canvas.create_text(x0, y0, text=number, anchor="center",
-                                font=("Arial", self.cell_size // 2, "bold"), fill=color)
-
-    def __draw_cell_content(self, row: int, col: int):
-        cell = self.sudokustate.get_cell(row, col)
-        if cell.isfixed():
-            self.__draw_fixed(row, col)
-            return
-
-        cell = self.sudokustate.get_cell(row, col)
-        if cell.number is not None:
-            self.__draw_number(row, col, cell.number)
-        else:
-            self.__draw_notes(row, col)
-
+    # (re)create the canvas items for the board's current size
+    def __create_items(self):
+        for item in self.rect_items + self.number_items + [item for notes in self.note_items for item in notes]:
+            self.canvas.delete(item)
+        g = self.sudokustate.geometry
+        self.geometry = g
+        self.size = self.cell_size * g.size
+        self.rect_items, self.number_items, self.note_items = [], [], []
+        self.rendered = [None] * g.ncells
+        for row in range(g.size):
+            for col in range(g.size):
+                x0, y0 = self.__get_cellpos(row, col)
+                self.rect_items.append(self.canvas.create_rectangle(x0, y0, x0 + self.cell_size, y0 + self.cell_size,
+                                                                    outline=self.border_color))
+                self.number_items.append(self.canvas.create_text(x0 + self.cell_size // 2, y0 + self.cell_size // 2,
+                                                                 text="", anchor="center",
+                                                                 font=("Arial", self.cell_size // 2, "bold")))
+                x1, y1 = x0 + self.cell_size // (2 * g.box), y0 + self.cell_size // (2 * g.box)
+                notes = []
+                for number in g.digits():
+                    offset_x, offset_y = self.__get_mini_number_offset(number)
+                    notes.append(self.canvas.create_text(x1 + offset_x, y1 + offset_y, text=DIGIT_CHARS[number],
+                                                         anchor="center",
+                                                         font=("Arial", self.cell_size // (g.box + 2), "bold"),
+                                                         fill=self.num_color_valid, state="hidden",
+                                                         tags=f"notes{row * g.size + col}"))
+                self.note_items.append(notes)
+
+    # what the cell should show: (fill color, number, number color, notes bitmask)
+    def __get_cell_look(self, row: int, col: int) -> tuple[str, str, str, int]:
+        fill_color = self.__get_cell_color(row, col)
+        i = row * self.sudokustate.geometry.size + col
+        number = self.sudokustate.numbers[i]
+        if number == 0:
+            return fill_color, "", "", self.sudokustate.notes[i]
+        if self.sudokustate.fixed >> i & 1:
+            return fill_color, DIGIT_CHARS[number], self.num_color_fixed, 0
+        conflicting = self.sudokustate.is_conflicting(row, col)
+        return fill_color, DIGIT_CHARS[number], self.num_color_invalid if conflicting else self.num_color_valid, 0
+
+    # notes sit in a box x box grid inside the cell
     def __get_mini_number_offset(self, number: int) -> tuple[int, int]:
-        mini_cell_x, mini_cell_y = (number - 1) % 3, (number - 1) // 3
-        mini_number_size = (self.cell_size // 3)
+        box = self.sudokustate.geometry.box
+        mini_cell_x, mini_cell_y = (number - 1) % box, (number - 1) // box
+        mini_number_size = (self.cell_size // box)
         return mini_number_size * mini_cell_x, mini_number_size * mini_cell_y
 
     def __get_cellpos(self, row: int, col: int) -> tuple[int, int]:
@@ -118,27 +134,46 @@ class SudokuRender:
             if col == self.selected_cell[1]:
                 return self.cell_color_selected_col
 
-        return self.cell_color1 if (row // 3 + col // 3) % 2 == 0 else self.cell_color2
+        box = self.sudokustate.geometry.box
+        return self.cell_color1 if (row // box + col // box) % 2 == 0 else self.cell_color2
 
+    # bring the cell's canvas items up to date, touching only what changed
     def __draw_cell(self, row: int, col: int):
-        x0, y0 = self.__get_cellpos(row, col)
-        x1, y1 = x0 + self.cell_size, y0 + self.cell_size
-        fill_color = self.__get_cell_color(row, col)
-        self.canvas.create_rectangle(x0, y0, x1, y1, fill=fill_color, outline=self.border_color)
-        self.__draw_cell_content(row, col)
+        i = row * self.sudokustate.geometry.size + col
+        look = self.__get_cell_look(row, col)
+        old = self.rendered[i]
+        if old == look:
+            return
 
+        (fill_color, number, number_color, notes) = look
+        (old_fill_color, old_number, old_number_color, old_notes) = old if old is not None else ("", "", "", 0)
+        if fill_color != old_fill_color:
+            self.canvas.itemconfig(self.rect_items[i], fill=fill_color)
+        if number != old_number or number_color != old_number_color:
+            self.canvas.itemconfig(self.number_items[i], text=number, fill=number_color)
+        if notes == 0 and old_notes != 0:
+            # hide all notes of the cell in one go
+            self.canvas.itemconfig(f"notes{i}", state="hidden")
+        else:
+            changed_notes = notes ^ old_notes
+            for n in self.sudokustate.geometry.digits():
+                if changed_notes >> n & 1:
+                    self.canvas.itemconfig(self.note_items[i][n - 1], state="normal" if notes >> n & 1 else "hidden")
+        self.rendered[i] = look
 
     def draw_sudoku(self):
-        self.__clear()
-        for row in range(9):
-            for col in range(9):
+        if self.geometry is not self.sudokustate.geometry:
+            self.__create_items()
+        for row in range(self.geometry.size):
+            for col in range(self.geometry.size):
                 self.__draw_cell(row, col)
-        self.canvas.update()
 
     def get_selected(self) -> Optional[tuple[int, int]]:
         return self.selected_cell
+
+    def select(self, row: int, col: int):
+        self.selected_cell = (row, col)
     
     def restart(self):
         self.selected_cell = None
-        self.__clear()
         self.draw_sudoku()
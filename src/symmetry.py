@@ -0,0 +1,206 @@
+import random
+from collections.abc import Sequence
+from itertools import permutations, product
+from operator import itemgetter
+from typing import TYPE_CHECKING, NamedTuple, Optional
+from sudoku import SudokuState, Difficulty, PuzzleSource
+
+if TYPE_CHECKING:
+    from grader import Grader
+
+# Validity-preserving transforms of a 9x9 board: reorder the bands and the
+# rows inside each band, reorder the stacks and the columns inside each
+# stack, optionally transpose, and relabel the digits. Any such transform
+# maps a puzzle to an equivalent one with the same number of solutions,
+# and maps its solutions along with it. Rotations and reflections belong
+# to the same group (a quarter turn is a transposition followed by
+# reversing the column order). Boards are 81 bytes in row-major order with
+# 0 for an empty cell.
+
+# the six orders of three bands (or stacks)
+BAND_ORDERS = list(permutations(range(3)))
+
+
+class Transform(NamedTuple):
+    # cell i of the transformed board is cell cells[i] of the original
+    cells: tuple[int, ...]
+    # digits[n] is the new label of digit n, digits[0] is always 0
+    digits: bytes
+
+    def apply(self, numbers: Sequence[int]) -> bytes:
+        return bytes(itemgetter(*self.cells)(numbers)).translate(_table(self.digits))
+
+    # map a transformed board back to the original's coordinates and labels
+    def invert(self, numbers: Sequence[int]) -> bytes:
+        inverse_digits = bytearray(10)
+        for n, m in enumerate(self.digits):
+            inverse_digits[m] = n
+        original = bytearray(81)
+        for i, j in enumerate(self.cells):
+            original[j] = numbers[i]
+        return bytes(original).translate(_table(bytes(inverse_digits)))
+
+
+IDENTITY_DIGITS = bytes(range(10))
+
+
+_TABLE_TAIL = bytes(range(10, 256))
+# numbers 0..9 to the characters '0'..'9'
+_DIGIT_CHARS = bytes.maketrans(bytes(range(10)), b"0123456789")
+
+
+def _table(digits: bytes) -> bytes:
+    return digits + _TABLE_TAIL
+
+
+def lines_of(band_order: Sequence[int], inner_orders: Optional[Sequence[Sequence[int]]] = None) -> list[int]:
+    if inner_orders is None:
+        inner_orders = [range(3)] * 3
+    return [3 * b + k for b, inner in zip(band_order, inner_orders) for k in inner]
+
+
+# cell permutation putting original row row_order[r] and column col_order[c]
+# at (r, c), then transposing the result if 'transpose' is set
+def cell_permutation(row_order: Sequence[int], col_order: Sequence[int], transpose: bool) -> tuple[int, ...]:
+    if transpose:
+        return tuple(row_order[c] * 9 + col_order[r] for r in range(9) for c in range(9))
+    return tuple(row_order[r] * 9 + col_order[c] for r in range(9) for c in range(9))
+
+
+# the 1296 orders of the nine rows (or columns) that keep every band together
+LINE_ORDERS = [lines_of(bands, inner) for bands in BAND_ORDERS for inner in product(BAND_ORDERS, repeat=3)]
+_ROW_GETTERS = [itemgetter(*cell_permutation(order, range(9), False)) for order in LINE_ORDERS]
+_COL_GETTERS = [itemgetter(*cell_permutation(range(9), order, False)) for order in LINE_ORDERS]
+_TRANSPOSE = itemgetter(*cell_permutation(range(9), range(9), True))
+
+
+# a uniformly drawn transform of the whole group. Without 'rng' the draw is
+# seeded from the global random state, so random.seed() makes it repeatable.
+def random_transform(rng: Optional[random.Random] = None) -> Transform:
+    rng = rng if rng is not None else random.Random(random.getrandbits(64))
+    cells = cell_permutation(rng.choice(LINE_ORDERS), rng.choice(LINE_ORDERS), rng.random() < 0.5)
+    labels = list(range(1, 10))
+    rng.shuffle(labels)
+    return Transform(cells, bytes([0] + labels))
+
+
+# same as random_transform(rng).apply(numbers) without building the cell
+# permutation: a few table lookups, no search
+def derive(numbers: bytes, rng: random.Random) -> bytes:
+    numbers = bytes(_ROW_GETTERS[rng.randrange(1296)](numbers))
+    numbers = bytes(_COL_GETTERS[rng.randrange(1296)](numbers))
+    if rng.random() < 0.5:
+        numbers = bytes(_TRANSPOSE(numbers))
+    labels = list(range(1, 10))
+    rng.shuffle(labels)
+    return numbers.translate(_table(bytes([0] + labels)))
+
+
+# seed source draws out of the rating band tolerated before generating one
+SEED_DRAWS = 8
+
+
+# A PuzzleSource deriving puzzles from verified-unique seed puzzles by
+# random transforms, microseconds per puzzle. Seeds added with add_seed()
+# are used for good. Without them, a seed is drawn from 'seed_source' (or
+# generated if that has none) and replaced after 'uses_per_seed' puzzles.
+# With a grader, drawn seeds outside the rating band of their difficulty
+# are skipped and generated seeds are rated; every derived puzzle has the
+# rating of its seed, so one rating covers 'uses_per_seed' puzzles.
+class PuzzleMultiplier:
+    uses_per_seed: int
+    seed_source: Optional[PuzzleSource]
+    grader: Optional["Grader"]
+    rng: random.Random
+    __seeds: dict[Difficulty, list[bytes]]
+    __current: dict[Difficulty, bytes]
+    __uses: dict[Difficulty, int]
+
+    def __init__(self, seed_source: Optional[PuzzleSource] = None, uses_per_seed: int = 1000,
+                 rng: Optional[random.Random] = None, grader: Optional["Grader"] = None):
+        self.uses_per_seed = uses_per_seed
+        self.seed_source = seed_source
+        self.grader = grader
+        self.rng = rng if rng is not None else random.Random(random.getrandbits(64))
+        self.__seeds = {d: [] for d in Difficulty}
+        self.__current = {}
+        self.__uses = {d: 0 for d in Difficulty}
+
+    # add a seed puzzle, raises ValueError unless it has exactly one solution
+    def add_seed(self, difficulty: Difficulty, line: str):
+        if SudokuState.from_line(line, difficulty).count_solutions(2) != 1:
+            raise ValueError(f"seed puzzle does not have a unique solution: {line}")
+        self.__seeds[difficulty].append(bytes(int(ch) for ch in line.replace(".", "0")))
+
+    def __seed(self, difficulty: Difficulty) -> bytes:
+        if len(self.__seeds[difficulty]) != 0:
+            return self.rng.choice(self.__seeds[difficulty])
+        if difficulty not in self.__current or self.__uses[difficulty] >= self.uses_per_seed:
+            line = self.__draw_seed(difficulty)
+            self.__current[difficulty] = bytes(int(ch) for ch in line)
+            self.__uses[difficulty] = 0
+        self.__uses[difficulty] += 1
+        return self.__current[difficulty]
+
+    # generated and banked puzzles are unique by construction
+    def __draw_seed(self, difficulty: Difficulty) -> str:
+        if self.seed_source is not None:
+            for _ in range(SEED_DRAWS):
+                line = self.seed_source.draw(difficulty)
+                if line is None:
+                    break
+                if self.grader is None or self.grader.matches(line, difficulty):
+                    return line
+        if self.grader is not None:
+            return self.grader.generate(difficulty)
+        return SudokuState(difficulty).to_line()
+
+    def draw(self, difficulty: Difficulty) -> Optional[str]:
+        return derive(self.__seed(difficulty), self.rng).translate(_DIGIT_CHARS).decode("ascii")
+
+
+# relabel the digits in order of first appearance: the first digit met in
+# row-major order becomes 1, the next new one 2 and so on. Digits missing
+# from the board take the remaining labels in ascending order.
+def _first_appearance_digits(numbers: bytes) -> bytes:
+    digits = bytearray(10)
+    label = 0
+    for n in dict.fromkeys(numbers):
+        if n != 0:
+            label += 1
+            digits[n] = label
+    if label < 9:
+        for n in range(1, 10):
+            if digits[n] == 0:
+                label += 1
+                digits[n] = label
+    return bytes(digits)
+
+
+# the 72 band/stack orders with and without transposition; together they
+# form a group, so the minimum over them is the same for every board of
+# an orbit. Row and column swaps inside a band or stack are left out: they
+# multiply the search by 1296 squared. The boards derive() makes do swap
+# them, so nearly all of those get keys of their own.
+CANONICAL_CELLS = [cell_permutation(lines_of(rows), lines_of(cols), transpose)
+                   for transpose in (False, True)
+                   for rows in BAND_ORDERS
+                   for cols in BAND_ORDERS]
+_CANONICAL_GETTERS = [itemgetter(*cells) for cells in CANONICAL_CELLS]
+
+
+# the lexicographically smallest board equivalent to 'numbers' under band
+# and stack reordering, transposition and digit relabeling, along with the
+# transform that produces it
+def canonical_form(numbers: Sequence[int]) -> tuple[bytes, Transform]:
+    best: Optional[bytes] = None
+    best_index = 0
+    best_digits = IDENTITY_DIGITS
+    for index, getter in enumerate(_CANONICAL_GETTERS):
+        moved = bytes(getter(numbers))
+        digits = _first_appearance_digits(moved)
+        candidate = moved.translate(_table(digits))
+        if best is None or candidate < best:
+            best, best_index, best_digits = candidate, index, digits
+    assert best is not None
+    return best, Transform(CANONICAL_CELLS[best_index], best_digits)
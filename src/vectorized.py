@@ -0,0 +1,114 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+import numpy as np
+
+# Vectorized checks over many 9x9 boards at once. A batch is an (N, 81)
+# uint8 array in row-major order with 0 for an empty cell. The results
+# follow SudokuState.number_is_valid: a filled cell is in conflict when
+# another cell of its row, column or box holds the same number.
+
+# cell indices of the 27 units: rows, then columns, then boxes
+UNITS = np.array([[r * 9 + c for c in range(9)] for r in range(9)]
+    + [[r * 9 + c for r in range(9)] for c in range(9)]
+    + [[(3 * (b // 3) + k // 3) * 9 + 3 * (b % 3) + k % 3 for k in range(9)] for b in range(9)],
+    dtype=np.intp)
+# the row, column and box unit of each cell, shape (81, 3)
+CELL_UNITS = np.array([(i // 9, 9 + i % 9, 18 + 3 * (i // 27) + i % 9 // 3) for i in range(81)], dtype=np.intp)
+# Per-digit counts are packed as 4-bit fields of a uint64, field n holding
+# the count of digit n; a unit has at most 9 cells so a field never overflows.
+NIBBLE_LOW_BITS = np.uint64(sum(1 << (4 * n) for n in range(10)))
+
+# boards processed per step, bounding the (chunk, 81, 3) temporaries
+CHUNK_SIZE = 4096
+
+
+@dataclass
+class BatchValidation:
+    # (N,) every cell filled and no conflict
+    solved: np.ndarray
+    # (N,) no conflict among the filled cells
+    valid: np.ndarray
+    # (N, 81) filled cells whose number conflicts with another cell
+    conflicts: np.ndarray
+
+
+def from_lines(lines: Iterable[str]) -> np.ndarray:
+    data = "".join(line.strip() for line in lines).replace(".", "0").encode("ascii")
+    boards = np.frombuffer(data, dtype=np.uint8) - ord("0")
+    return boards.reshape(-1, 81)
+
+
+def to_lines(boards: np.ndarray) -> list[str]:
+    data = (np.asarray(boards, dtype=np.uint8) + ord("0")).tobytes().decode("ascii")
+    return [data[i:i + 81] for i in range(0, len(data), 81)]
+
+
+def _check(boards: np.ndarray) -> np.ndarray:
+    boards = np.asarray(boards)
+    if boards.ndim != 2 or boards.shape[1] != 81:
+        raise ValueError(f"expected an (N, 81) array of boards, got shape {boards.shape}")
+    if boards.size != 0 and boards.max() > 9:
+        raise ValueError("board values must be in 0..9")
+    return boards.astype(np.uint8, copy=False)
+
+
+def _packed_cells(boards: np.ndarray) -> np.ndarray:
+    packed = np.left_shift(np.uint64(1), 4 * boards.astype(np.uint64))
+    packed[boards == 0] = 0
+    return packed
+
+
+# how many cells of every unit hold each digit, shape (N, 27, 10)
+def digit_counts(boards: np.ndarray) -> np.ndarray:
+    boards = _check(boards)
+    unit_sums = _packed_cells(boards)[:, UNITS].sum(axis=2, dtype=np.uint64)
+    shifts = 4 * np.arange(10, dtype=np.uint64)
+    return ((unit_sums[:, :, None] >> shifts) & np.uint64(0xF)).astype(np.uint8)
+
+
+# for each cell, field n is nonzero when another cell sharing a unit with
+# it holds digit n (the cell itself left out), shape (N, 81) packed uint64
+def _peer_digits(boards: np.ndarray) -> np.ndarray:
+    packed = _packed_cells(boards)
+    unit_sums = packed[:, UNITS].sum(axis=2, dtype=np.uint64)
+    peers = unit_sums[:, CELL_UNITS] - packed[:, :, None]
+    nonzero = (peers | peers >> np.uint64(1) | peers >> np.uint64(2) | peers >> np.uint64(3)) & NIBBLE_LOW_BITS
+    return np.bitwise_or.reduce(nonzero, axis=2)
+
+
+def _validate_chunk(boards: np.ndarray) -> BatchValidation:
+    used = _peer_digits(boards)
+    conflicts = (boards != 0) & ((used >> (4 * boards.astype(np.uint64))) & np.uint64(1) != 0)
+    valid = ~conflicts.any(axis=1)
+    solved = valid & (boards != 0).all(axis=1)
+    return BatchValidation(solved=solved, valid=valid, conflicts=conflicts)
+
+
+def validate(boards: np.ndarray) -> BatchValidation:
+    boards = _check(boards)
+    parts = [_validate_chunk(boards[i:i + CHUNK_SIZE]) for i in range(0, len(boards), CHUNK_SIZE)]
+    if len(parts) == 0:
+        return BatchValidation(solved=np.zeros(0, dtype=bool), valid=np.zeros(0, dtype=bool),
+                               conflicts=np.zeros((0, 81), dtype=bool))
+    return BatchValidation(solved=np.concatenate([p.solved for p in parts]),
+                           valid=np.concatenate([p.valid for p in parts]),
+                           conflicts=np.concatenate([p.conflicts for p in parts]))
+
+
+def _candidates_chunk(boards: np.ndarray) -> np.ndarray:
+    used = _peer_digits(boards)
+    masks = np.zeros(used.shape, dtype=np.uint16)
+    for n in range(1, 10):
+        free = (used >> np.uint64(4 * n)) & np.uint64(1) == 0
+        masks |= free.astype(np.uint16) << np.uint16(n)
+    return masks
+
+
+# candidate bitmask of every cell, shape (N, 81) uint16: bit n is set when
+# number_is_valid would accept n there, as SudokuState.get_candidate_mask
+def candidate_masks(boards: np.ndarray) -> np.ndarray:
+    boards = _check(boards)
+    if len(boards) == 0:
+        return np.zeros((0, 81), dtype=np.uint16)
+    return np.concatenate([_candidates_chunk(boards[i:i + CHUNK_SIZE])
+                           for i in range(0, len(boards), CHUNK_SIZE)])